@@ -0,0 +1,185 @@
+# batch.py
+#
+# Several topology variants from one parsed inventory. The CSV is parsed once; each
+# scenario builds on Device.fork() copies, so variants never see each other's hubs or
+# tunnels, and scenarios run on a process pool into their own output directories.
+# Forked workers inherit the parsed devices copy-on-write instead of receiving a
+# pickled copy each.
+
+import gc
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field, fields
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Union
+from models import Device
+from planner import plan_capacity
+from sinks import DirectorySink
+from config import Config, NetworkTopology
+import pipeline
+import instrumentation
+
+REPORT_NAME = "batch_report.json"
+TOPOLOGIES = (NetworkTopology.FULL_MESH, NetworkTopology.HUB_SPOKE, NetworkTopology.PEER_TO_PEER,
+              NetworkTopology.EDGE_LIST, NetworkTopology.REGIONAL)
+
+@dataclass
+class Scenario:
+    name: str
+    topology: str = NetworkTopology.FULL_MESH
+    hubs: List[str] = field(default_factory=list)
+    devices: List[str] = field(default_factory=list)
+    edges: Optional[str] = None
+    regional_mesh: Optional[int] = None
+    hubs_per_spoke: Optional[int] = None
+    # One limit for every hub or a {name: limit} mapping, as --hub-capacity
+    hub_capacity: Union[int, Dict[str, int], None] = None
+    regional_hubs: int = Config.REGIONAL_HUBS
+    compact: bool = False
+    internet_router: bool = False
+    internet_router_shards: int = 1
+    aggregate_wans: bool = False
+
+    @staticmethod
+    def from_dict(data: Dict) -> 'Scenario':
+        known = {f.name for f in fields(Scenario)}
+        unknown = sorted(set(data) - known)
+        if unknown:
+            raise ValueError(f"Unknown scenario keys: {', '.join(unknown)}")
+        data = dict(data)
+        for key in ('hubs', 'devices'):
+            if isinstance(data.get(key), str):
+                data[key] = [name.strip() for name in data[key].split(',') if name.strip()]
+        scenario = Scenario(**data)
+        scenario.validate()
+        return scenario
+
+    def validate(self):
+        if not self.name or os.sep in self.name or self.name in ('.', '..'):
+            raise ValueError(f"Scenario name {self.name!r} cannot be used as a directory name")
+        if self.topology not in TOPOLOGIES:
+            raise ValueError(f"Scenario {self.name}: unknown topology {self.topology!r}")
+        if self.topology == NetworkTopology.HUB_SPOKE and not self.hubs:
+            raise ValueError(f"Scenario {self.name}: hub_spoke needs hubs")
+        if self.topology == NetworkTopology.PEER_TO_PEER and len(self.devices) != 2:
+            raise ValueError(f"Scenario {self.name}: peer needs exactly two devices")
+        if self.topology == NetworkTopology.EDGE_LIST and not self.edges and self.regional_mesh is None:
+            raise ValueError(f"Scenario {self.name}: edges needs an edge file or regional_mesh")
+        if self.hub_capacity and self.hubs_per_spoke is None:
+            raise ValueError(f"Scenario {self.name}: hub_capacity needs hubs_per_spoke")
+        if self.internet_router_shards < 1:
+            raise ValueError(f"Scenario {self.name}: internet_router_shards must be at least 1")
+
+    def hub_limits(self) -> Dict[str, int]:
+        if isinstance(self.hub_capacity, int):
+            return {name: self.hub_capacity for name in self.hubs}
+        return dict(self.hub_capacity or {})
+
+def load_scenarios(path: str) -> List[Scenario]:
+    # A JSON list of scenario objects, or an object with a "scenarios" list
+    with open(path, 'r') as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get('scenarios', [])
+    scenarios = [Scenario.from_dict(item) for item in data]
+    names = [scenario.name for scenario in scenarios]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate scenario names: {', '.join(duplicates)}")
+    if not scenarios:
+        raise ValueError(f"No scenarios in {path}")
+    return scenarios
+
+# Parsed inventory shared by the scenario workers, set by _init_worker
+_devices: List[Device] = []
+
+def _init_worker(devices: List[Device]):
+    global _devices
+    _devices = devices
+    # Nothing a worker records would make it back to the parent
+    instrumentation.disable()
+
+def run_scenario(scenario: Scenario, devices: List[Device], output_dir: Union[str, Path]) -> Dict:
+    # Builds and writes one scenario; failures are reported in the result rather
+    # than raised so the other scenarios still complete
+    start = time.perf_counter()
+    result = {'scenario': scenario.name, 'topology': scenario.topology, 'output': str(output_dir)}
+    try:
+        forked = [device.fork() for device in devices]
+        configured, hub_sites, edges = pipeline.resolve_topology(
+            forked, scenario.topology, scenario.hubs or None, scenario.devices, scenario.edges,
+            scenario.regional_mesh, scenario.hubs_per_spoke, scenario.hub_limits(), scenario.regional_hubs)
+        capacity_plan = plan_capacity(configured, scenario.topology, hub_sites, edges, compact=scenario.compact)
+        if not capacity_plan.ok:
+            raise ValueError("; ".join(capacity_plan.errors[:5]))
+
+        builder = pipeline.build_network(configured, scenario.topology, hub_sites, edges=edges)
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+        sink = DirectorySink(str(output_dir))
+        pipeline.write_device_configs(configured, sink, compact=scenario.compact)
+        if scenario.internet_router:
+            pipeline.write_internet_router_configs(configured, sink, scenario.internet_router_shards,
+                                                   scenario.aggregate_wans)
+
+        device_sizes = [sink.sizes[device.name] for device in configured]
+        tunnel_counts = [len(device.tunnel_interfaces) for device in configured]
+        result.update({
+            'devices': len(configured),
+            'hubs': len(hub_sites or []),
+            'tunnel_pairs': len(builder.tunnels),
+            'tunnel_interfaces': sum(tunnel_counts),
+            'max_tunnels_per_device': max(tunnel_counts, default=0),
+            'files': len(sink.entries),
+            'total_bytes': sum(sink.sizes.values()),
+            'max_config_bytes': max(device_sizes, default=0),
+            'mean_config_bytes': sum(device_sizes) // len(device_sizes) if device_sizes else 0,
+        })
+    except Exception as e:
+        result['error'] = str(e)
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    return result
+
+def _run_worker(scenario: Scenario, output_dir: str) -> Dict:
+    return run_scenario(scenario, _devices, output_dir)
+
+def run_batch(devices: List[Device], scenarios: List[Scenario], output_root: str, workers: int = 1) -> Iterator[Dict]:
+    # Yields one result per scenario as it finishes; output goes to output_root/<name>
+    root = Path(output_root)
+    root.mkdir(parents=True, exist_ok=True)
+    if workers <= 1 or len(scenarios) < 2:
+        for scenario in scenarios:
+            yield run_scenario(scenario, devices, root / scenario.name)
+        return
+
+    # Frozen objects are skipped by the collector, so workers' collections don't
+    # write to (and copy) the pages holding the inherited devices
+    gc.freeze()
+    try:
+        with ProcessPoolExecutor(max_workers=min(workers, len(scenarios)),
+                                 initializer=_init_worker, initargs=(devices,)) as executor:
+            futures = [executor.submit(_run_worker, scenario, str(root / scenario.name)) for scenario in scenarios]
+            for future in as_completed(futures):
+                yield future.result()
+    finally:
+        gc.unfreeze()
+
+def write_batch_report(results: List[Dict], output_root: str) -> Path:
+    path = Path(output_root) / REPORT_NAME
+    with open(path, 'w') as f:
+        json.dump({'scenarios': results}, f, indent=2)
+    return path
+
+def comparison_table(results: List[Dict]) -> str:
+    columns = [('scenario', 'Scenario'), ('topology', 'Topology'), ('devices', 'Devices'),
+               ('tunnel_interfaces', 'Tunnels'), ('max_tunnels_per_device', 'Max/device'),
+               ('total_bytes', 'Total bytes'), ('max_config_bytes', 'Max bytes'), ('seconds', 'Seconds')]
+    rows = [[title for _, title in columns]]
+    rows.extend([str(result.get(key, '')) for key, _ in columns] for result in results if 'error' not in result)
+    widths = [max(len(row[i]) for row in rows) for i in range(len(columns))]
+    # Names and topologies left aligned, numbers right aligned
+    lines = ["  ".join(cell.ljust(width) if i < 2 else cell.rjust(width)
+                       for i, (cell, width) in enumerate(zip(row, widths))) for row in rows]
+    lines.extend(f"{result['scenario']}: error: {result['error']}" for result in results if 'error' in result)
+    return "\n".join(lines)
@@ -0,0 +1,170 @@
+# benchmarks/bench.py
+#
+# Timed scenarios over a synthetic inventory. Run from the repository root:
+#
+#   python -m benchmarks.bench --sites 500 --wans 2 --save benchmarks/baseline.json
+#   python -m benchmarks.bench --sites 500 --wans 2 --compare benchmarks/baseline.json
+
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+import pipeline
+from config import NetworkTopology
+from generators import ConfigGenerator, RenderContext
+from network import NetworkBuilder, TunnelAddressManager
+from benchmarks.inventory import hub_names, write_inventory
+
+# Large enough for a full mesh of a few thousand single-WAN sites, and clear of the
+# synthetic WAN and LAN ranges
+BENCH_TUNNEL_POOL = "100.64.0.0/10"
+SCENARIOS = ['load', 'build_full_mesh', 'build_hub_spoke', 'build_regional', 'render', 'write', 'internet_router']
+
+def _build(devices, topology: str, hubs: Optional[List[str]] = None) -> NetworkBuilder:
+    builder = NetworkBuilder(devices, topology, hubs, TunnelAddressManager(BENCH_TUNNEL_POOL))
+    builder.build()
+    return builder
+
+def _tunnel_pairs(devices) -> int:
+    # Every tunnel has an interface on both of its devices
+    return sum(len(d.tunnel_interfaces) for d in devices) // 2
+
+def _measure(setup: Callable, run: Callable, memory: bool) -> Dict:
+    # run() gets setup()'s result and returns (tunnel pairs processed, bytes produced);
+    # pairs are counted the same way in every scenario so the rates compare.
+    # Peak memory is taken in a second, untimed pass so tracing does not skew the timing.
+    state = setup()
+    start = time.perf_counter()
+    tunnel_pairs, output_bytes = run(state)
+    seconds = time.perf_counter() - start
+    result = {
+        'seconds': round(seconds, 6),
+        'tunnel_pairs': tunnel_pairs,
+        'bytes': output_bytes,
+        'tunnel_pairs_per_second': round(tunnel_pairs / seconds, 1) if tunnel_pairs and seconds else None,
+    }
+
+    if memory:
+        state = setup()
+        tracemalloc.start()
+        try:
+            run(state)
+            result['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 1e6, 3)
+        finally:
+            tracemalloc.stop()
+    return result
+
+def run_benchmarks(sites: int, wans: int = 1, local_networks: int = 1, hub_ratio: float = 0.01,
+                   scenarios: Optional[List[str]] = None, memory: bool = True) -> Dict:
+    scenarios = scenarios or SCENARIOS
+    hubs = hub_names(sites, hub_ratio)
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_file = str(Path(tmp) / "inventory.csv")
+        write_inventory(csv_file, sites, wans, local_networks)
+        output_dir = Path(tmp) / "out"
+        output_dir.mkdir()
+
+        load = lambda: pipeline.load_devices(csv_file)
+        full_mesh = lambda: _build(load(), NetworkTopology.FULL_MESH).devices
+
+        def render(devices):
+            context = RenderContext()
+            output_bytes = 0
+            for device in devices:
+                output_bytes += sum(len(fragment) for fragment in ConfigGenerator.iter_device_config(device, context))
+            return _tunnel_pairs(devices), output_bytes
+
+        def write(devices):
+            written = pipeline.write_device_configs(devices, str(output_dir))
+            return _tunnel_pairs(devices), sum(p.stat().st_size for p in written)
+
+        def parse(_):
+            load()
+            return 0, Path(csv_file).stat().st_size
+
+        def internet_router(devices):
+            path = pipeline.write_internet_router_config(devices, str(output_dir))
+            return 0, path.stat().st_size
+
+        cases = {
+            'load': (lambda: None, parse),
+            'build_full_mesh': (load, lambda devices: (len(_build(devices, NetworkTopology.FULL_MESH).tunnels), 0)),
+            'build_hub_spoke': (load, lambda devices: (len(_build(devices, NetworkTopology.HUB_SPOKE, hubs).tunnels), 0)),
+            'build_regional': (load, lambda devices: (len(_build(devices, NetworkTopology.REGIONAL).tunnels), 0)),
+            'render': (full_mesh, render),
+            'write': (full_mesh, write),
+            'internet_router': (load, internet_router),
+        }
+        for name in scenarios:
+            setup, run = cases[name]
+            results[name] = _measure(setup, run, memory)
+
+    return {
+        'parameters': {'sites': sites, 'wans': wans, 'local_networks': local_networks, 'hub_ratio': hub_ratio},
+        'python': platform.python_version(),
+        'results': results,
+    }
+
+def compare(report: Dict, baseline: Dict, threshold: float) -> List[str]:
+    # A scenario regresses when it is more than `threshold` slower (or larger) than the
+    # baseline; differences under 10 ms / 1 MB are treated as noise
+    regressions = []
+    if report['parameters'] != baseline.get('parameters'):
+        regressions.append(f"baseline was recorded with {baseline.get('parameters')}, not {report['parameters']}")
+        return regressions
+
+    for name, result in report['results'].items():
+        previous = baseline['results'].get(name)
+        if not previous:
+            continue
+        for metric, noise in (('seconds', 0.01), ('peak_mb', 1.0)):
+            if metric not in result or metric not in previous:
+                continue
+            if result[metric] > previous[metric] * (1 + threshold) and result[metric] - previous[metric] > noise:
+                regressions.append(f"{name}: {metric} {previous[metric]} -> {result[metric]}")
+    return regressions
+
+def print_report(report: Dict):
+    print(f"{'scenario':<18}{'seconds':>10}{'peak MB':>10}{'pairs':>10}{'pairs/s':>12}{'bytes':>14}")
+    for name, result in report['results'].items():
+        print(f"{name:<18}{result['seconds']:>10.3f}{result.get('peak_mb', float('nan')):>10.1f}"
+              f"{result['tunnel_pairs']:>10}{result['tunnel_pairs_per_second'] or 0:>12.0f}{result['bytes']:>14}")
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Mesh-Me scaling benchmarks")
+    parser.add_argument("--sites", type=int, default=200)
+    parser.add_argument("--wans", type=int, default=1, help="WAN interfaces per site")
+    parser.add_argument("--local-networks", type=int, default=1, help="Local networks per site")
+    parser.add_argument("--hub-ratio", type=float, default=0.01)
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="Run only these scenarios")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the peak memory pass")
+    parser.add_argument("--save", help="Write the report as a JSON baseline")
+    parser.add_argument("--compare", help="Baseline JSON to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown before failing")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.sites, args.wans, args.local_networks, args.hub_ratio,
+                            args.scenario, not args.no_memory)
+    print_report(report)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+# benchmarks/inventory.py
+#
+# Synthetic inventory generator producing CSVs in the Script-Inputs-TEMPLATE.csv schema.
+
+import argparse
+import csv
+import math
+from typing import List
+
+HEADERS = ['device_name', 'site_id', 'location', 'wan_ips', 'wan_interfaces', 'wan_gateways',
+           'local_networks', 'bgp_as_number', 'bgp_neighbor_as', 'encryption_key']
+
+# WANs get consecutive /29s from 11.0.0.0 and LANs consecutive /24s from 10.0.0.0,
+# so neither overlaps the other nor Config.TUNNEL_NETWORK for up to 65k sites
+WAN_BASE = 11 << 24
+LAN_BASE = 10 << 24
+BASE_AS = 64512
+
+def _ip(value: int) -> str:
+    return f"{value >> 24}.{(value >> 16) & 255}.{(value >> 8) & 255}.{value & 255}"
+
+def site_name(index: int) -> str:
+    return f"SITE{index + 1:05d}"
+
+def generate_rows(sites: int, wans_per_site: int = 1, local_networks: int = 1,
+                  regions: int = 10) -> List[dict]:
+    rows = []
+    for index in range(sites):
+        wan_ips, wan_gateways, wan_interfaces = [], [], []
+        for wan in range(wans_per_site):
+            subnet = WAN_BASE + (index * wans_per_site + wan) * 8
+            wan_ips.append(f"{_ip(subnet + 2)}/29")
+            wan_gateways.append(_ip(subnet + 1))
+            wan_interfaces.append(f"GigabitEthernet0/{wan}")
+        lans = [f"{_ip(LAN_BASE + (index * local_networks + lan) * 256)}/24" for lan in range(local_networks)]
+
+        rows.append({
+            'device_name': site_name(index),
+            # Multiples of 100 put every site's tunnel numbers at the bottom of the range,
+            # so the generated meshes never trip the 10000 tunnel number limit
+            'site_id': str((index + 1) * 100),
+            'location': f"REGION{index % regions:02d}",
+            'wan_ips': ",".join(wan_ips),
+            'wan_interfaces': ",".join(wan_interfaces),
+            'wan_gateways': ",".join(wan_gateways),
+            'local_networks': ",".join(lans),
+            'bgp_as_number': str(BASE_AS + index),
+            'bgp_neighbor_as': str(BASE_AS),
+            'encryption_key': "C1sco12345",
+        })
+    return rows
+
+def hub_names(sites: int, hub_ratio: float) -> List[str]:
+    hubs = max(1, math.ceil(sites * hub_ratio)) if hub_ratio > 0 else 0
+    return [site_name(index) for index in range(min(hubs, sites))]
+
+def write_inventory(path: str, sites: int, wans_per_site: int = 1, local_networks: int = 1,
+                    regions: int = 10):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=HEADERS)
+        writer.writeheader()
+        writer.writerows(generate_rows(sites, wans_per_site, local_networks, regions))
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic inventory CSV")
+    parser.add_argument("output", help="CSV file to write")
+    parser.add_argument("--sites", type=int, default=100)
+    parser.add_argument("--wans", type=int, default=1, help="WAN interfaces per site")
+    parser.add_argument("--local-networks", type=int, default=1, help="Local networks per site")
+    parser.add_argument("--regions", type=int, default=10, help="Number of distinct locations")
+    parser.add_argument("--hub-ratio", type=float, default=0.01, help="Fraction of sites listed as hubs")
+    args = parser.parse_args()
+
+    write_inventory(args.output, args.sites, args.wans, args.local_networks, args.regions)
+    print(",".join(hub_names(args.sites, args.hub_ratio)))
+
+if __name__ == "__main__":
+    main()
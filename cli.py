@@ -0,0 +1,363 @@
+# cli.py
+#
+# Headless entry point. Only the generation modules are imported here so that
+# batch runs never pay for tkinter or the GUI setup, and each subcommand imports
+# its own modules so a plain generate does not load watch, batch or diff support.
+
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+from config import Config, NetworkTopology
+
+if TYPE_CHECKING:
+    from models import Device
+    from delta import DeviceDelta
+
+TOPOLOGIES = [NetworkTopology.FULL_MESH, NetworkTopology.HUB_SPOKE, NetworkTopology.PEER_TO_PEER,
+              NetworkTopology.EDGE_LIST, NetworkTopology.REGIONAL]
+
+PREFLIGHT_ERRORS_SHOWN = 10
+
+def _split_names(value: Optional[str]) -> List[str]:
+    if not value:
+        return []
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+def _add_topology_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("-t", "--topology", choices=TOPOLOGIES, default=NetworkTopology.FULL_MESH)
+    parser.add_argument("--hubs", help="Comma separated hub device names (hub_spoke, or regional to pick "
+                                       "the hubs of their regions)")
+    parser.add_argument("--hubs-per-spoke", type=int, metavar="K",
+                        help="Connect each spoke to K balanced hubs instead of every hub (hub_spoke)")
+    parser.add_argument("--hub-capacity", metavar="LIMITS",
+                        help="Maximum tunnels per hub with --hubs-per-spoke: one number for every hub "
+                             "or NAME=N pairs separated by commas. A full hub can move spokes between "
+                             "runs unless --ledger keeps the previous assignment")
+    parser.add_argument("--regional-hubs", type=int, default=Config.REGIONAL_HUBS, metavar="N",
+                        help="Hubs chosen by lowest site ID in regions without --hubs (regional)")
+    parser.add_argument("--devices", help="Comma separated device names (peer)")
+    parser.add_argument("--edges", help="CSV of device name pairs to connect (edges)")
+    parser.add_argument("--regional-mesh", type=int, metavar="K",
+                        help="Connect each site to K neighbors in its location plus a regional backbone "
+                             "(edges, 0 meshes each location fully)")
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="mesh-me", description="Mesh Network Configuration Generator")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    generate = subparsers.add_parser("generate", help="Generate device configurations from an inventory CSV")
+    generate.add_argument("csv_file", help="Inventory CSV file")
+    output = generate.add_mutually_exclusive_group(required=True)
+    output.add_argument("-o", "--output", help="Output directory, one file per device")
+    output.add_argument("--archive",
+                        help="Write every config into one archive; the format follows the extension "
+                             "(.tar, .tar.gz, .tar.zst, .zip, or .ndjson with a .idx offset index)")
+    _add_topology_arguments(generate)
+    generate.add_argument("--no-snapshot", action="store_true",
+                          help="Always parse the CSV instead of reusing its cached snapshot")
+    generate.add_argument("--no-preflight", action="store_true",
+                          help="Skip the capacity plan that rejects oversized topologies before building")
+    generate.add_argument("--ledger", help="Tunnel allocation ledger file, reused and updated across runs")
+    generate.add_argument("--incremental", action="store_true",
+                          help="Only re-render devices whose inputs changed since the last run")
+    generate.add_argument("--compact", action="store_true",
+                          help="Render BGP neighbors through shared peer-groups and one tunnel-group per peer address")
+    generate.add_argument("-j", "--workers", type=int, default=1,
+                          help="Render devices on this many processes (0 uses every CPU)")
+    generate.add_argument("--report", help="Write per-phase timings and counters to this JSON file")
+    generate.add_argument("--profile", action="store_true", help="Add cProfile output to the report (needs --report)")
+    generate.add_argument("--trace-memory", action="store_true",
+                          help="Add tracemalloc peak and top allocations to the report (needs --report)")
+    generate.add_argument("--delta-against", metavar="DEPLOYED",
+                          help="Compare the written configs with this deployed directory or archive")
+    generate.add_argument("--delta-report", help="Change set file for --delta-against (JSON lines)")
+    generate.add_argument("--internet-router", action="store_true", help="Include internet router configuration")
+    generate.add_argument("--internet-router-shards", type=int, default=1, metavar="N",
+                          help="Split the sites across N internet routers joined by an eBGP mesh")
+    generate.add_argument("--aggregate-wans", action="store_true",
+                          help="Announce aggregated WAN blocks from the internet routers")
+    generate.set_defaults(func=run_generate)
+
+    plan = subparsers.add_parser("plan", help="Predict tunnel counts, address and tunnel number usage, "
+                                              "output size and run time without building anything")
+    plan.add_argument("csv_file", help="Inventory CSV file")
+    _add_topology_arguments(plan)
+    plan.add_argument("--no-snapshot", action="store_true",
+                      help="Always parse the CSV instead of reusing its cached snapshot")
+    plan.add_argument("--compact", action="store_true", help="Estimate sizes for --compact output")
+    plan.add_argument("--json", help="Also write the full per-device plan to this JSON file")
+    plan.set_defaults(func=run_plan)
+
+    watch_parser = subparsers.add_parser("watch", help="Regenerate whenever the inventory CSV changes, "
+                                                      "rewriting only the affected configs")
+    watch_parser.add_argument("csv_file", help="Inventory CSV file")
+    watch_parser.add_argument("-o", "--output", required=True, help="Output directory, one file per device")
+    _add_topology_arguments(watch_parser)
+    watch_parser.add_argument("--compact", action="store_true",
+                              help="Render BGP neighbors through shared peer-groups and one tunnel-group per peer address")
+    watch_parser.add_argument("--ledger", help="Tunnel allocation ledger file (kept in memory by default)")
+    watch_parser.add_argument("--interval", type=float,
+                              help="Seconds between checks of the CSV (default 0.5)")
+    watch_parser.set_defaults(func=run_watch)
+
+    batch_parser = subparsers.add_parser("batch", help="Generate several topology scenarios from one parsed "
+                                                      "inventory and compare them")
+    batch_parser.add_argument("csv_file", help="Inventory CSV file")
+    batch_parser.add_argument("scenarios", help="JSON list of scenarios: name, topology and the topology "
+                                                "options, one output directory each")
+    batch_parser.add_argument("-o", "--output", required=True, help="Root directory for the scenario outputs")
+    batch_parser.add_argument("-j", "--workers", type=int, default=0,
+                              help="Scenarios built in parallel (default: CPU count)")
+    batch_parser.add_argument("--no-snapshot", action="store_true",
+                              help="Always parse the CSV instead of reusing its cached snapshot")
+    batch_parser.set_defaults(func=run_batch)
+
+    diff = subparsers.add_parser("diff", help="Compare a generated config set against the deployed one "
+                                              "and list the stanzas to add and remove per device")
+    diff.add_argument("deployed", help="Deployed config directory or archive")
+    diff.add_argument("generated", help="Generated config directory or archive")
+    diff.add_argument("--json", help="Write the change set, one JSON object per changed device, to this file")
+    diff.set_defaults(func=run_diff)
+
+    validate = subparsers.add_parser("validate", help="Check an inventory CSV and report every bad row")
+    validate.add_argument("csv_file", help="Inventory CSV file")
+    validate.set_defaults(func=run_validate)
+
+    return parser
+
+def run_validate(args: argparse.Namespace) -> int:
+    from inventory import InventoryReader
+    from overlaps import find_address_conflicts
+
+    reader = InventoryReader(args.csv_file)
+    devices = list(reader)
+    for error in reader.errors:
+        print(error)
+    conflicts = find_address_conflicts(devices)
+    for conflict in conflicts:
+        print(conflict)
+    print(f"{reader.rows} rows, {len(devices)} valid devices, {len(reader.errors)} problems, "
+          f"{len(conflicts)} address conflicts")
+    return 1 if reader.errors or conflicts else 0
+
+def _topology_options(args: argparse.Namespace) -> Tuple[Optional[List[str]], List[str]]:
+    topology = args.topology
+    hub_sites = None
+    if topology in (NetworkTopology.HUB_SPOKE, NetworkTopology.REGIONAL):
+        hub_sites = _split_names(args.hubs)
+    if topology == NetworkTopology.HUB_SPOKE and not hub_sites:
+        raise ValueError("Please specify at least one hub site with --hubs")
+    selected = _split_names(args.devices)
+    if topology == NetworkTopology.PEER_TO_PEER and len(selected) != 2:
+        raise ValueError("Please specify exactly two devices with --devices")
+
+    if args.hub_capacity and args.hubs_per_spoke is None:
+        raise ValueError("--hub-capacity needs --hubs-per-spoke")
+    if topology == NetworkTopology.EDGE_LIST and not args.edges and args.regional_mesh is None:
+        raise ValueError("Please specify --edges or --regional-mesh for edge list topology")
+    return hub_sites, selected
+
+def _hub_capacity(value: Optional[str], hub_sites: List[str]) -> Dict[str, int]:
+    if not value:
+        return {}
+    if "=" not in value:
+        return {name: int(value) for name in hub_sites}
+    limits = {}
+    for item in _split_names(value):
+        name, _, limit = item.partition("=")
+        limits[name.strip()] = int(limit)
+    return limits
+
+def _topology_devices(args: argparse.Namespace, devices: List['Device'], selected: List[str],
+                      hub_sites: Optional[List[str]], previous_edges: Optional[list] = None):
+    import pipeline
+
+    if args.topology == NetworkTopology.REGIONAL and args.regional_hubs < 1:
+        raise ValueError("--regional-hubs must be at least 1")
+    # Once hub capacity binds, spokes keep the hubs a ledger recorded for them
+    ledger_path = getattr(args, 'ledger', None)
+    if args.hub_capacity and ledger_path and previous_edges is None:
+        previous_edges = pipeline.ledger_hub_assignments(ledger_path, devices, hub_sites)
+    return pipeline.resolve_topology(devices, args.topology, hub_sites, selected, args.edges, args.regional_mesh,
+                                     args.hubs_per_spoke, _hub_capacity(args.hub_capacity, hub_sites or []),
+                                     args.regional_hubs, previous_edges)
+
+def run_plan(args: argparse.Namespace) -> int:
+    import pipeline
+    from planner import plan_capacity
+
+    hub_sites, selected = _topology_options(args)
+    start = time.perf_counter()
+    devices, hub_sites, edges = _topology_devices(args, pipeline.load_devices(args.csv_file, not args.no_snapshot),
+                                                  selected, hub_sites)
+    capacity_plan = plan_capacity(devices, args.topology, hub_sites, edges, compact=args.compact)
+    elapsed = time.perf_counter() - start
+
+    print(capacity_plan.summary())
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(capacity_plan.to_dict(), f, indent=2)
+    print(f"Planned in {elapsed:.3f}s")
+    return 0 if capacity_plan.ok else 1
+
+def _report_delta(deltas: Iterable['DeviceDelta'], json_path: Optional[str]) -> Dict[str, int]:
+    from delta import write_delta_report
+
+    def reported():
+        for delta in deltas:
+            if delta.status != "unchanged":
+                print(delta.summary())
+            yield delta
+
+    if json_path:
+        totals = write_delta_report(reported(), json_path)
+    else:
+        totals = {'changed': 0, 'unchanged': 0, 'new': 0, 'removed': 0}
+        for delta in reported():
+            totals[delta.status] += 1
+    print(", ".join(f"{count} {status}" for status, count in totals.items()) + " devices")
+    return totals
+
+def run_diff(args: argparse.Namespace) -> int:
+    from delta import diff_config_sets
+    import sinks
+
+    _report_delta(diff_config_sets(args.deployed, sinks.read_configs(args.generated)), args.json)
+    return 0
+
+def run_watch(args: argparse.Namespace) -> int:
+    import watch
+
+    hub_sites, selected = _topology_options(args)
+    Path(args.output).mkdir(parents=True, exist_ok=True)
+    session = watch.WatchSession(
+        args.csv_file, args.output, args.topology,
+        lambda devices, previous_edges: _topology_devices(args, devices, selected, hub_sites, previous_edges),
+        args.compact, args.ledger)
+    print(f"Watching {args.csv_file}, press Ctrl+C to stop")
+    try:
+        watch.watch(session, interval=args.interval or watch.POLL_INTERVAL)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        session.close()
+    return 0
+
+def run_batch(args: argparse.Namespace) -> int:
+    import batch
+    import pipeline
+
+    scenarios = batch.load_scenarios(args.scenarios)
+    start = time.perf_counter()
+    devices = pipeline.load_devices(args.csv_file, not args.no_snapshot)
+    workers = args.workers or os.cpu_count() or 1
+    results = {}
+    for result in batch.run_batch(devices, scenarios, args.output, workers):
+        status = f"error: {result['error']}" if 'error' in result else f"{result['files']} files"
+        print(f"{result['scenario']}: {status} in {result['seconds']:.3f}s")
+        results[result['scenario']] = result
+    ordered = [results[scenario.name] for scenario in scenarios]
+    report = batch.write_batch_report(ordered, args.output)
+
+    print()
+    print(batch.comparison_table(ordered))
+    print(f"Built {len(scenarios)} scenarios in {time.perf_counter() - start:.3f}s, report in {report}")
+    return 1 if any('error' in result for result in ordered) else 0
+
+def run_generate(args: argparse.Namespace) -> int:
+    import pipeline
+    import sinks
+    import instrumentation
+
+    topology = args.topology
+    hub_sites, selected = _topology_options(args)
+    if args.archive and args.incremental:
+        raise ValueError("--incremental needs a directory output (--output)")
+    if args.delta_report and not args.delta_against:
+        raise ValueError("--delta-report needs --delta-against")
+    if args.internet_router_shards < 1:
+        raise ValueError("--internet-router-shards must be at least 1")
+
+    metrics = instrumentation.enable(args.profile, args.trace_memory) if args.report else None
+
+    start = time.perf_counter()
+    devices = pipeline.load_devices(args.csv_file, not args.no_snapshot)
+    devices_to_configure, hub_sites, edges = _topology_devices(args, devices, selected, hub_sites)
+    if not args.no_preflight:
+        from planner import plan_capacity
+
+        # The planner renders stub configs to estimate sizes; keep those out of render.*
+        with instrumentation.phase("preflight"), instrumentation.suspended():
+            capacity_plan = plan_capacity(devices_to_configure, topology, hub_sites, edges, compact=args.compact)
+        if not capacity_plan.ok:
+            errors = capacity_plan.errors[:PREFLIGHT_ERRORS_SHOWN]
+            if len(capacity_plan.errors) > len(errors):
+                errors.append(f"... and {len(capacity_plan.errors) - len(errors)} more (see the plan command)")
+            raise ValueError("Capacity plan failed:\n  " + "\n  ".join(errors))
+        for warning in capacity_plan.warnings:
+            print(f"Warning: {warning}", file=sys.stderr)
+
+    pipeline.build_network(devices_to_configure, topology, hub_sites, args.ledger, edges)
+
+    # Opened only after the preflight and the build so a rejected run leaves no empty
+    # archive behind
+    if args.archive:
+        destination = args.archive
+        sink = sinks.open_sink(args.archive)
+    else:
+        destination = args.output
+        Path(args.output).mkdir(parents=True, exist_ok=True)
+        sink = sinks.DirectorySink(args.output)
+
+    workers = args.workers or os.cpu_count() or 1
+    try:
+        with sink:
+            written = pipeline.write_device_configs(devices_to_configure, sink, args.incremental, workers,
+                                                    compact=args.compact)
+            if args.internet_router:
+                written.extend(pipeline.write_internet_router_configs(devices_to_configure, sink,
+                                                                      args.internet_router_shards,
+                                                                      args.aggregate_wans))
+    except BaseException:
+        # A truncated archive is unreadable; don't leave one, or an NDJSON index into
+        # it, behind
+        if args.archive:
+            Path(args.archive).unlink(missing_ok=True)
+            if isinstance(sink, sinks.NdjsonSink):
+                Path(f"{args.archive}.idx").unlink(missing_ok=True)
+        raise
+    elapsed = time.perf_counter() - start
+
+    if metrics is not None:
+        metrics.write_report(args.report)
+        instrumentation.disable()
+
+    tunnels = sum(len(d.tunnel_interfaces) for d in devices_to_configure)
+    print(f"Wrote {len(written)} configuration files for {len(devices_to_configure)} devices "
+          f"({tunnels} tunnel interfaces) to {destination} in {elapsed:.3f}s")
+
+    if args.delta_against:
+        from delta import diff_config_sets
+
+        # Read back from the destination so incremental runs include unchanged files;
+        # anything else already in the output directory is left out
+        names = {device.name for device in devices_to_configure} | set(sink.sizes)
+        generated = ((name, config) for name, config in sinks.read_configs(destination) if name in names)
+        _report_delta(diff_config_sets(args.delta_against, generated), args.delta_report)
+    return 0
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        return args.func(args)
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
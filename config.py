@@ -6,8 +6,13 @@ class Config:
     AS_PREPEND_COUNT = 3
     TUNNEL_BASE = 100
     TUNNEL_NETWORK = "172.26.0.0/15"
+    TUNNEL_PREFIX_LENGTH = 29
+    REGIONAL_HUBS = 2
     INTERNET_ROUTER_NAME = "INTERNET-RTR"
     INTERNET_ROUTER_AS = "65000"
+    # Sharded internet routers use AS base + shard number and /31 links from this pool
+    INTERNET_ROUTER_SHARD_AS_BASE = 64900
+    INTERNET_ROUTER_MESH_NETWORK = "198.18.0.0/15"
     SLA_FREQUENCY = 5
     SLA_TIMEOUT = 1
     SLA_THRESHOLD = 2
@@ -25,4 +30,6 @@ class Config:
 class NetworkTopology:
     FULL_MESH = "full"
     HUB_SPOKE = "hub_spoke"
-    PEER_TO_PEER = "peer"
\ No newline at end of file
+    PEER_TO_PEER = "peer"
+    EDGE_LIST = "edges"
+    REGIONAL = "regional"
\ No newline at end of file
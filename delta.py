@@ -0,0 +1,131 @@
+# delta.py
+#
+# Keyed comparison of generated configs against the last deployed set. Each config
+# is indexed by stanza (interfaces by name, tunnel-groups by peer address, BGP
+# neighbors by address, everything else by its first line) so the change set lists
+# whole stanzas to add and remove instead of a line diff.
+
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from sinks import read_configs
+
+NEIGHBOR_PATTERN = re.compile(r"\s+neighbor (\S+) ")
+
+@dataclass
+class DeviceDelta:
+    device: str
+    # Stanza key -> stanza text
+    added: Dict[str, str] = field(default_factory=dict)
+    removed: Dict[str, str] = field(default_factory=dict)
+    # Stanza key -> (deployed text, generated text)
+    changed: Dict[str, Tuple[str, str]] = field(default_factory=dict)
+    unchanged: int = 0
+    # 'changed', 'unchanged', 'new' (not deployed yet) or 'removed' (no longer generated)
+    status: str = "changed"
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.added or self.removed or self.changed)
+
+    def to_dict(self) -> Dict:
+        return {
+            'device': self.device,
+            'status': self.status,
+            'add': [self.added[key] for key in self.added] + [new for _, new in self.changed.values()],
+            'remove': [self.removed[key] for key in self.removed] + [old for old, _ in self.changed.values()],
+            'added': list(self.added),
+            'removed': list(self.removed),
+            'changed': list(self.changed),
+            'unchanged': self.unchanged,
+        }
+
+    def summary(self) -> str:
+        return (f"{self.device}: {self.status}, +{len(self.added)} -{len(self.removed)} "
+                f"~{len(self.changed)} ({self.unchanged} unchanged)")
+
+def _stanza_key(line: str) -> str:
+    words = line.split()
+    if words[0] == "interface" and len(words) > 1:
+        return f"interface {words[1]}"
+    if words[0] in ("tunnel-group", "group-policy") and len(words) > 1:
+        # Spread over several top level lines that share the name
+        return f"{words[0]} {words[1]}"
+    return line.rstrip()
+
+def index_config(config: str) -> Dict[str, str]:
+    # Stanza key -> stanza text, in config order. Comments and blank lines are dropped
+    # and trailing whitespace is ignored; neighbors are taken out of the router bgp
+    # stanza and keyed by address so one new peer does not change the whole block.
+    stanzas: Dict[str, List[str]] = {}
+    current = None
+    in_bgp = False
+    for line in config.splitlines():
+        line = line.rstrip()
+        if not line or line.lstrip().startswith("!"):
+            continue
+        if not line[0].isspace():
+            current = _stanza_key(line)
+            in_bgp = line.startswith("router bgp ")
+            stanzas.setdefault(current, []).append(line)
+            continue
+        if current is None:
+            current = line.strip()
+        if in_bgp:
+            match = NEIGHBOR_PATTERN.match(line)
+            if match:
+                stanzas.setdefault(f"neighbor {match.group(1)}", []).append(line)
+                continue
+        stanzas.setdefault(current, []).append(line)
+    return {key: "\n".join(lines) for key, lines in stanzas.items()}
+
+def diff_configs(device: str, deployed: Optional[str], generated: Optional[str]) -> DeviceDelta:
+    if deployed == generated:
+        # Identical text is only indexed to count its stanzas
+        return DeviceDelta(device, unchanged=len(index_config(generated)) if generated else 0,
+                           status="unchanged")
+
+    old = index_config(deployed or "")
+    new = index_config(generated or "")
+    delta = DeviceDelta(device)
+    if deployed is None:
+        delta.status = "new"
+    elif generated is None:
+        delta.status = "removed"
+
+    for key, text in new.items():
+        previous = old.get(key)
+        if previous is None:
+            delta.added[key] = text
+        elif previous != text:
+            delta.changed[key] = (previous, text)
+        else:
+            delta.unchanged += 1
+    for key, text in old.items():
+        if key not in new:
+            delta.removed[key] = text
+    if delta.is_empty:
+        delta.status = "unchanged"
+    return delta
+
+def diff_config_sets(deployed: str, generated: Iterable[Tuple[str, str]]) -> Iterator[DeviceDelta]:
+    # deployed is a config directory or archive (anything sinks.read_configs reads);
+    # generated yields (device name, config). Devices only in the deployed set are
+    # reported last with status 'removed'.
+    previous = dict(read_configs(deployed))
+    for device, config in generated:
+        yield diff_configs(device, previous.pop(device, None), config)
+    for device in sorted(previous):
+        yield diff_configs(device, previous[device], None)
+
+def write_delta_report(deltas: Iterable[DeviceDelta], path: str, include_unchanged: bool = False) -> Dict[str, int]:
+    # Streams one JSON object per device so large change sets never sit in memory as
+    # a whole; returns the device counts per status
+    totals = {'changed': 0, 'unchanged': 0, 'new': 0, 'removed': 0}
+    with open(path, 'w') as f:
+        for delta in deltas:
+            totals[delta.status] += 1
+            if delta.status != "unchanged" or include_unchanged:
+                f.write(json.dumps(delta.to_dict()) + "\n")
+    return totals
@@ -1,29 +1,21 @@
 # generators.py
 
+from typing import Iterator, Optional, TextIO
 from models import Device, InternetRouter
 from config import Config
-from ipaddress import IPv4Network
+from utils import prefix_to_netmask
+import instrumentation
 
-class ConfigGenerator:
-    @staticmethod
-    def generate_device_config(device: Device) -> str:
-        config = f"""!
-! Configuration for {device.name} ({device.location})
-! Site ID: {device.site_id}
-! Role: {'Hub' if device.is_hub else 'Spoke'}
-!
-"""
-        config += ConfigGenerator._generate_failover_policy(device)
-        config += ConfigGenerator._generate_interface_config(device)
-        config += ConfigGenerator._generate_crypto_config(device)
-        config += ConfigGenerator._generate_bgp_config(device)
-        return config
-
-    @staticmethod
-    def _generate_failover_policy(device: Device) -> str:
-        config = "\n! WAN Failover Policy\n"
-        if len(device.wan_interfaces) > 1:
-            config += """
+class RenderContext:
+    # Blocks that only depend on Config are formatted once per run, and the
+    # per-tunnel/per-neighbor templates have every run constant substituted up
+    # front so rendering a device only fills in its dynamic fields.
+    # compact renders BGP neighbors as peer-group members and emits one tunnel-group
+    # per destination instead of one per tunnel.
+    def __init__(self, compact: bool = False):
+        self.compact = compact
+        self.tunnel_netmask = prefix_to_netmask(Config.TUNNEL_PREFIX_LENGTH)
+        self.failover_policy = """
 ! Interface health monitoring policy
 policy-map type inspect dns preset_dns_map
  parameters
@@ -50,11 +42,7 @@ policy-map global_policy
   inspect ip-options
   inspect icmp
 """
-        return config
-
-    @staticmethod
-    def _generate_interface_config(device: Device) -> str:
-        config = """
+        self.bfd_templates = """
 ! BFD Template Configuration
 bfd-template multi-hop INTERFACES
  interval min-tx {0} min-rx {1} multiplier {2}
@@ -64,51 +52,14 @@ bfd-template single-hop default
 
 bfd slow-timers 2000
 """.format(
-        Config.BFD_TEMPLATE_MULTI_TX,
-        Config.BFD_TEMPLATE_MULTI_RX,
-        Config.BFD_TEMPLATE_MULTI_MULT,
-        Config.BFD_TEMPLATE_SINGLE_TX,
-        Config.BFD_TEMPLATE_SINGLE_RX,
-        Config.BFD_TEMPLATE_SINGLE_MULT
-    )
-
-        local_ip, local_netmask = device.get_local_network_address()
-        if local_ip and local_netmask:
-            config += f"""
-interface Vlan17
- nameif inside
- security-level 100
- ip address {local_ip} {local_netmask}
- no shutdown
-"""
-
-        for i, wan in enumerate(device.wan_interfaces):
-            interface_name = f"outside-{wan.name.lower().replace('/', '_')}"
-
-            config += f"""
-interface {wan.name}
- nameif {interface_name}
- security-level 0
- ip address {wan.ip} {wan.netmask}
- bfd interval {Config.BFD_INTERFACE_TX} min_rx {Config.BFD_INTERFACE_RX} multiplier {Config.BFD_INTERFACE_MULT}
-"""
-
-        for tunnel in device.tunnel_interfaces:
-            intf_name = f"SVTI-{device.location}-{tunnel.name}"
-            config += f"""
-interface {tunnel.name}
- nameif {intf_name}
- ip address {tunnel.local_ip} 255.255.255.248
- tunnel source interface outside-{tunnel.source_wan.name.lower().replace('/', '_')}
- tunnel destination {tunnel.destination_wan.ip}
- tunnel mode ipsec ipv4
- tunnel protection ipsec profile VPN-LAB-PROFILE
-"""
-        return config
-
-    @staticmethod
-    def _generate_crypto_config(device: Device) -> str:
-        return f"""
+            Config.BFD_TEMPLATE_MULTI_TX,
+            Config.BFD_TEMPLATE_MULTI_RX,
+            Config.BFD_TEMPLATE_MULTI_MULT,
+            Config.BFD_TEMPLATE_SINGLE_TX,
+            Config.BFD_TEMPLATE_SINGLE_RX,
+            Config.BFD_TEMPLATE_SINGLE_MULT
+        )
+        self.crypto_header = """
 ! IPSec and IKEv2 Configuration
 crypto ikev2 policy 1
  encryption aes-256
@@ -137,65 +88,215 @@ crypto ipsec profile VPN-LAB-PROFILE
  set security-association lifetime seconds 1000
 
 ! Tunnel Group Configurations
-{ConfigGenerator._generate_tunnel_groups(device)}
 """
+        self.bgp_communities = f"""
+ community-list standard PRIMARY permit {Config.PRIMARY_COMMUNITY}
+ community-list standard BACKUP permit {Config.BACKUP_COMMUNITY}
+ 
+ address-family ipv4 unicast
+"""
+        self.route_map_tail = """  no auto-summary
+  no synchronization
+ exit-address-family
 
-    @staticmethod
-    def _generate_tunnel_groups(device: Device) -> str:
-        config = ""
-        for tunnel in device.tunnel_interfaces:
-            config += f"""
-tunnel-group {tunnel.destination_wan.ip} type ipsec-l2l
-tunnel-group {tunnel.destination_wan.ip} general-attributes
+! Route Maps for Path Selection
+route-map PRIMARY-OUT permit 10
+ set community """ + Config.PRIMARY_COMMUNITY + """
+
+route-map BACKUP-OUT permit 10
+ set community """ + Config.BACKUP_COMMUNITY + """
+ set as-path prepend"""
+
+        self.wan_template = (f"""
+interface {{name}}
+ nameif {{nameif}}
+ security-level 0
+ ip address {{ip}} {{netmask}}
+ bfd interval {Config.BFD_INTERFACE_TX} min_rx {Config.BFD_INTERFACE_RX} multiplier {Config.BFD_INTERFACE_MULT}
+""").format
+        self.tunnel_template = (f"""
+interface {{0}}
+ nameif SVTI-{{1}}-{{0}}
+ ip address {{2}} {self.tunnel_netmask}
+ tunnel source interface {{3}}
+ tunnel destination {{4}}
+ tunnel mode ipsec ipv4
+ tunnel protection ipsec profile VPN-LAB-PROFILE
+""").format
+        self.tunnel_group_template = """
+tunnel-group {0} type ipsec-l2l
+tunnel-group {0} general-attributes
  default-group-policy VPN-LAB-POLICY
-tunnel-group {tunnel.destination_wan.ip} ipsec-attributes
- ikev2 remote-authentication pre-shared-key {device.encryption_key}
- ikev2 local-authentication pre-shared-key {device.encryption_key}
-tunnel-group {tunnel.destination_wan.ip} ikev2-ipsec-attributes
+tunnel-group {0} ipsec-attributes
+ ikev2 remote-authentication pre-shared-key {1}
+ ikev2 local-authentication pre-shared-key {1}
+tunnel-group {0} ikev2-ipsec-attributes
  isakmp keepalive threshold 15 retry 3
+""".format
+        neighbor_attributes = {
+            is_primary: """  neighbor {0} ebgp-multihop 2
+  neighbor {0} fall-over bfd """ + ("single-hop" if is_primary else "") + """
+  neighbor {0} activate
+  neighbor {0} send-community
+  neighbor {0} route-map """ + ('PRIMARY-OUT' if is_primary else 'BACKUP-OUT') + """ out
 """
-        return config
+            for is_primary in (True, False)
+        }
+        self.neighbor_templates = {
+            is_primary: ("  neighbor {0} remote-as {1}\n" + attributes).format
+            for is_primary, attributes in neighbor_attributes.items()
+        }
+        self.peer_groups = {True: "PRIMARY-PEERS", False: "BACKUP-PEERS"}
+        self.peer_group_definitions = {
+            is_primary: f"  neighbor {name} peer-group\n" + neighbor_attributes[is_primary].format(name)
+            for is_primary, name in self.peer_groups.items()
+        }
+        self.peer_group_member_templates = {
+            is_primary: ("  neighbor {0} remote-as {1}\n  neighbor {0} peer-group " + name + "\n").format
+            for is_primary, name in self.peer_groups.items()
+        }
+
+    @staticmethod
+    def wan_nameif(wan_name: str) -> str:
+        return f"outside-{wan_name.lower().replace('/', '_')}"
+
+class ConfigGenerator:
+    @staticmethod
+    def generate_device_config(device: Device, context: Optional[RenderContext] = None) -> str:
+        return "".join(ConfigGenerator.iter_device_config(device, context))
+
+    @staticmethod
+    def write_device_config(device: Device, stream: TextIO, context: Optional[RenderContext] = None):
+        stream.writelines(ConfigGenerator.iter_device_config(device, context))
+
+    @staticmethod
+    def iter_device_config(device: Device, context: Optional[RenderContext] = None) -> Iterator[str]:
+        # Yields the config in fragments no larger than one interface or neighbor block,
+        # so a device with thousands of tunnels can be streamed without building one string.
+        # Pass one RenderContext per run to reuse the static blocks across devices.
+        context = context or RenderContext()
+        yield f"""!
+! Configuration for {device.name} ({device.location})
+! Site ID: {device.site_id}
+! Role: {'Hub' if device.is_hub else 'Spoke'}
+!
+"""
+        metrics = instrumentation.active()
+        for name, section in (("failover_policy", ConfigGenerator._iter_failover_policy),
+                              ("interface_config", ConfigGenerator._iter_interface_config),
+                              ("crypto_config", ConfigGenerator._iter_crypto_config),
+                              ("bgp_config", ConfigGenerator._iter_bgp_config)):
+            if metrics is None:
+                yield from section(device, context)
+            else:
+                yield from metrics.timed_iter(f"render.{name}", section(device, context))
+
+    @staticmethod
+    def _generate_failover_policy(device: Device) -> str:
+        return "".join(ConfigGenerator._iter_failover_policy(device, RenderContext()))
+
+    @staticmethod
+    def _generate_interface_config(device: Device) -> str:
+        return "".join(ConfigGenerator._iter_interface_config(device, RenderContext()))
+
+    @staticmethod
+    def _generate_crypto_config(device: Device) -> str:
+        return "".join(ConfigGenerator._iter_crypto_config(device, RenderContext()))
+
+    @staticmethod
+    def _generate_tunnel_groups(device: Device) -> str:
+        return "".join(ConfigGenerator._iter_tunnel_groups(device, RenderContext()))
 
     @staticmethod
     def _generate_bgp_config(device: Device) -> str:
-        config = f"""
-! BGP Configuration
-router bgp {device.bgp_as_numbers[0]}
- bgp log-neighbor-changes
- bgp bestpath compare-routerid
+        return "".join(ConfigGenerator._iter_bgp_config(device, RenderContext()))
 
- community-list standard PRIMARY permit {Config.PRIMARY_COMMUNITY}
- community-list standard BACKUP permit {Config.BACKUP_COMMUNITY}
- 
- address-family ipv4 unicast
+    @staticmethod
+    def _iter_failover_policy(device: Device, context: RenderContext) -> Iterator[str]:
+        yield "\n! WAN Failover Policy\n"
+        if len(device.wan_interfaces) > 1:
+            yield context.failover_policy
+
+    @staticmethod
+    def _iter_interface_config(device: Device, context: RenderContext) -> Iterator[str]:
+        yield context.bfd_templates
+
+        local_ip, local_netmask = device.get_local_network_address()
+        if local_ip and local_netmask:
+            yield f"""
+interface Vlan17
+ nameif inside
+ security-level 100
+ ip address {local_ip} {local_netmask}
+ no shutdown
 """
+
+        wan_template = context.wan_template
+        nameifs = {}
+        for wan in device.wan_interfaces:
+            nameifs[wan.name] = nameif = context.wan_nameif(wan.name)
+            yield wan_template(name=wan.name, nameif=nameif, ip=wan.ip, netmask=wan.netmask)
+
+        tunnel_template = context.tunnel_template
+        location = device.location
         for tunnel in device.tunnel_interfaces:
-            bfd_type = "single-hop" if tunnel.is_primary else ""
-            config += f"""  neighbor {tunnel.remote_ip} remote-as {tunnel.remote_as}
-  neighbor {tunnel.remote_ip} ebgp-multihop 2
-  neighbor {tunnel.remote_ip} fall-over bfd {bfd_type}
-  neighbor {tunnel.remote_ip} activate
-  neighbor {tunnel.remote_ip} send-community
-  neighbor {tunnel.remote_ip} route-map {'PRIMARY-OUT' if tunnel.is_primary else 'BACKUP-OUT'} out
-"""
+            source_wan = tunnel.source_wan.name
+            nameif = nameifs.get(source_wan) or context.wan_nameif(source_wan)
+            yield tunnel_template(tunnel.name, location, tunnel.local_ip, nameif, tunnel.destination_wan.ip)
 
-        for network in device.local_networks:
-            config += f"  network {network.ip} mask {network.netmask}\n"
+    @staticmethod
+    def _iter_crypto_config(device: Device, context: RenderContext) -> Iterator[str]:
+        yield context.crypto_header
+        tunnel_groups = ConfigGenerator._iter_tunnel_groups(device, context)
+        # Timed on its own as well, and included in render.crypto_config
+        metrics = instrumentation.active()
+        yield from metrics.timed_iter("render.tunnel_groups", tunnel_groups) if metrics else tunnel_groups
+        yield "\n"
 
-        if local_ip := device.get_local_network_address()[0]:
-            network = IPv4Network(f"{local_ip}/{device.local_networks[0].netmask}", strict=False)
-            config += f"  network {network.network_address} mask {network.netmask}\n"
+    @staticmethod
+    def _iter_tunnel_groups(device: Device, context: RenderContext) -> Iterator[str]:
+        tunnel_group_template = context.tunnel_group_template
+        encryption_key = device.encryption_key
+        if not context.compact:
+            for tunnel in device.tunnel_interfaces:
+                yield tunnel_group_template(tunnel.destination_wan.ip, encryption_key)
+            return
 
-        config += """  no auto-summary
-  no synchronization
- exit-address-family
+        # Tunnels from several local WANs to the same peer address share one tunnel-group
+        seen = set()
+        for tunnel in device.tunnel_interfaces:
+            destination = tunnel.destination_wan.ip
+            if destination not in seen:
+                seen.add(destination)
+                yield tunnel_group_template(destination, encryption_key)
 
-! Route Maps for Path Selection
-route-map PRIMARY-OUT permit 10
- set community """ + Config.PRIMARY_COMMUNITY + """
+    @staticmethod
+    def _iter_bgp_config(device: Device, context: RenderContext) -> Iterator[str]:
+        local_as = device.bgp_as_numbers[0]
+        yield f"""
+! BGP Configuration
+router bgp {local_as}
+ bgp log-neighbor-changes
+ bgp bestpath compare-routerid
+"""
+        yield context.bgp_communities
 
-route-map BACKUP-OUT permit 10
- set community """ + Config.BACKUP_COMMUNITY + """
- set as-path prepend""" + "".join([f" {device.bgp_as_numbers[0]}" for _ in range(Config.AS_PREPEND_COUNT)]) + "\n"
+        if context.compact:
+            used = {tunnel.is_primary for tunnel in device.tunnel_interfaces}
+            for is_primary in (True, False):
+                if is_primary in used:
+                    yield context.peer_group_definitions[is_primary]
+            neighbor_templates = context.peer_group_member_templates
+        else:
+            neighbor_templates = context.neighbor_templates
+        for tunnel in device.tunnel_interfaces:
+            yield neighbor_templates[tunnel.is_primary](tunnel.remote_ip, tunnel.remote_as)
+
+        for network in device.local_networks:
+            yield f"  network {network.ip} mask {network.netmask}\n"
+
+        if device.local_networks:
+            network = device.local_networks[0]
+            yield f"  network {network.network_address} mask {network.prefix_netmask}\n"
 
-        return config
+        yield context.route_map_tail + f" {local_as}" * Config.AS_PREPEND_COUNT + "\n"
@@ -1,19 +1,27 @@
+import queue
+import threading
+import time
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 from pathlib import Path
-import csv
-from typing import List
-from models import Device, NetworkAddress, InternetRouter
-from network import NetworkBuilder
-from generators import ConfigGenerator
-from config import NetworkTopology, Config
-from utils import validate_csv_headers
+from typing import List, Optional
+from config import NetworkTopology
+from network import BuildCancelled
+import pipeline
+
+# How often the Tk event loop drains progress messages from the worker thread
+POLL_INTERVAL_MS = 100
 
 class Application:
     def __init__(self):
         self.root = tk.Tk()
         self.root.title("Mesh Network Configuration Generator")
+        self.worker: Optional[threading.Thread] = None
+        self.cancel_event = threading.Event()
+        self.progress_queue = queue.Queue()
+        self._phase_started = {}
         self.setup_ui()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
     def setup_ui(self):
         # File selection
@@ -33,6 +41,8 @@ class Application:
                        value=NetworkTopology.HUB_SPOKE, command=self.toggle_selection_frames).grid(row=0, column=1, padx=5)
         ttk.Radiobutton(topology_frame, text="Peer to Peer", variable=self.topology_var,
                        value=NetworkTopology.PEER_TO_PEER, command=self.toggle_selection_frames).grid(row=0, column=2, padx=5)
+        ttk.Radiobutton(topology_frame, text="Regional", variable=self.topology_var,
+                       value=NetworkTopology.REGIONAL, command=self.toggle_selection_frames).grid(row=0, column=3, padx=5)
 
         # Device selection
         self.device_frame = ttk.Frame(self.root, padding="10")
@@ -55,9 +65,23 @@ class Application:
         ttk.Checkbutton(self.root, text="Include Internet Router Configuration", 
                        variable=self.include_internet).grid(row=4, column=0, pady=5)
 
-        # Generate button
-        ttk.Button(self.root, text="Generate Configuration", 
-                  command=self.generate_config).grid(row=5, column=0, pady=10)
+        # Generate and cancel buttons
+        button_frame = ttk.Frame(self.root)
+        button_frame.grid(row=5, column=0, pady=10)
+        self.generate_button = ttk.Button(button_frame, text="Generate Configuration", 
+                                          command=self.generate_config)
+        self.generate_button.grid(row=0, column=0, padx=5)
+        self.cancel_button = ttk.Button(button_frame, text="Cancel", command=self.cancel_generation,
+                                        state=tk.DISABLED)
+        self.cancel_button.grid(row=0, column=1, padx=5)
+
+        # Progress
+        progress_frame = ttk.Frame(self.root, padding="10")
+        progress_frame.grid(row=6, column=0, sticky=(tk.W, tk.E))
+        self.progress_bar = ttk.Progressbar(progress_frame, length=300, mode='determinate')
+        self.progress_bar.grid(row=0, column=0, sticky=(tk.W, tk.E))
+        self.progress_label = ttk.Label(progress_frame, text="")
+        self.progress_label.grid(row=1, column=0, sticky=tk.W)
 
     def select_file(self):
         filename = filedialog.askopenfilename(filetypes=[("CSV files", "*.csv")])
@@ -68,12 +92,7 @@ class Application:
 
     def load_devices(self):
         try:
-            if not validate_csv_headers(self.csv_file):
-                raise ValueError("Invalid CSV headers")
-                
-            with open(self.csv_file, 'r') as f:
-                reader = csv.DictReader(f)
-                self.devices = [Device(row) for row in reader]
+            self.devices = pipeline.load_devices(self.csv_file, use_snapshot=True)
             
             # Clear and populate both listboxes
             self.hub_listbox.delete(0, tk.END)
@@ -87,7 +106,8 @@ class Application:
 
     def toggle_selection_frames(self):
         topology = self.topology_var.get()
-        if topology == NetworkTopology.HUB_SPOKE:
+        if topology in (NetworkTopology.HUB_SPOKE, NetworkTopology.REGIONAL):
+            # Hub selection is optional for regional; unselected regions pick their own
             self.hub_frame.grid()
             self.device_frame.grid_remove()
         elif topology == NetworkTopology.PEER_TO_PEER:
@@ -127,56 +147,125 @@ class Application:
         return True
 
     def generate_config(self):
-        if not self.validate_input():
+        if self.worker is not None or not self.validate_input():
+            return
+
+        topology = self.topology_var.get()
+        hub_sites = None
+        if topology in (NetworkTopology.HUB_SPOKE, NetworkTopology.REGIONAL):
+            hub_sites = self.get_selected_hubs()
+        devices_to_configure = pipeline.select_devices(self.devices, topology, self.get_selected_devices())
+
+        output_dir = filedialog.askdirectory(title="Select Output Directory")
+        if not output_dir:
             return
 
+        # Build, render and write run on a worker thread; it only talks to Tk through
+        # progress_queue, which _poll_worker drains from the event loop
+        self.cancel_event = threading.Event()
+        self.progress_queue = queue.Queue()
+        self._phase_started = {}
+        self.worker = threading.Thread(
+            target=self._generation_worker,
+            args=(devices_to_configure, topology, hub_sites, output_dir, self.include_internet.get()),
+            daemon=True
+        )
+        self.generate_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.NORMAL)
+        self.progress_label.config(text="Building tunnels...")
+        self.worker.start()
+        self.root.after(POLL_INTERVAL_MS, self._poll_worker)
+
+    def cancel_generation(self):
+        self.cancel_event.set()
+        self.cancel_button.config(state=tk.DISABLED)
+        self.progress_label.config(text="Cancelling...")
+
+    def on_close(self):
+        if self.worker is not None:
+            self.cancel_event.set()
+            self.worker.join()
+        self.root.destroy()
+
+    def _generation_worker(self, devices, topology: str, hub_sites, output_dir: str, include_internet: bool):
+        post = self.progress_queue.put
         try:
-            topology = self.topology_var.get()
-            hub_sites = self.get_selected_hubs() if topology == NetworkTopology.HUB_SPOKE else None
-            
-            # For peer-to-peer, only use selected devices
-            if topology == NetworkTopology.PEER_TO_PEER:
-                selected_devices = self.get_selected_devices()
-                devices_to_configure = [d for d in self.devices if d.name in selected_devices]
-            else:
-                devices_to_configure = self.devices
-            
-            network_builder = NetworkBuilder(devices_to_configure, topology, hub_sites)
-            network_builder.build()
-            
-            output_dir = filedialog.askdirectory(title="Select Output Directory")
-            if not output_dir:
-                return
-                
-            for device in devices_to_configure:
-                config = ConfigGenerator.generate_device_config(device)
-                output_file = Path(output_dir) / f"{device.name}_config.txt"
-                with open(output_file, 'w') as f:
-                    f.write(config)
-
-            if self.include_internet.get():
-                self._generate_internet_router_config(output_dir, devices_to_configure)
-            
-            messagebox.showinfo("Success", "Configuration files generated successfully!")
-            
+            pipeline.build_network(devices, topology, hub_sites,
+                                   progress=lambda tunnels: post(('build', tunnels, 0)),
+                                   cancel=self.cancel_event)
+
+            # Files only appear in output_dir once every one of them has been written
+            with pipeline.staged_output(output_dir) as staging_dir:
+                pipeline.write_device_configs(devices, staging_dir,
+                                              progress=lambda done, total: post(('render', done, total)),
+                                              cancel=self.cancel_event)
+                if include_internet:
+                    self._generate_internet_router_config(staging_dir, devices)
+                if self.cancel_event.is_set():
+                    raise pipeline.GenerationCancelled("Generation cancelled")
+            post(('done', len(devices), 0))
+        except BuildCancelled:
+            post(('cancelled', 0, 0))
         except Exception as e:
-            messagebox.showerror("Error", f"Error generating configuration: {str(e)}")
+            post(('error', str(e), 0))
+
+    def _poll_worker(self):
+        finished = None
+        try:
+            while True:
+                message = self.progress_queue.get_nowait()
+                if message[0] in ('build', 'render'):
+                    self._show_progress(*message)
+                else:
+                    finished = message
+        except queue.Empty:
+            pass
+
+        if finished is None:
+            self.root.after(POLL_INTERVAL_MS, self._poll_worker)
+            return
+
+        self.worker.join()
+        self.worker = None
+        self.progress_bar.stop()
+        self.progress_bar.config(mode='determinate', value=0)
+        self.generate_button.config(state=tk.NORMAL)
+        self.cancel_button.config(state=tk.DISABLED)
+
+        status, detail, _ = finished
+        if status == 'done':
+            self.progress_bar.config(value=100)
+            self.progress_label.config(text=f"Generated {detail} device configurations")
+            messagebox.showinfo("Success", "Configuration files generated successfully!")
+        elif status == 'cancelled':
+            self.progress_label.config(text="Cancelled, no files were written")
+        else:
+            self.progress_label.config(text="Failed")
+            messagebox.showerror("Error", f"Error generating configuration: {detail}")
+
+    def _show_progress(self, phase: str, done: int, total: int):
+        now = time.perf_counter()
+        started = self._phase_started.setdefault(phase, now)
+        rate = done / (now - started) if now > started else 0.0
+
+        if phase == 'build':
+            if str(self.progress_bar.cget('mode')) != 'indeterminate':
+                self.progress_bar.config(mode='indeterminate')
+                self.progress_bar.start()
+            self.progress_label.config(text=f"Building tunnels: {done} built ({rate:,.0f}/s)")
+            return
+
+        if str(self.progress_bar.cget('mode')) != 'determinate':
+            self.progress_bar.stop()
+            self.progress_bar.config(mode='determinate')
+        self.progress_bar.config(value=100 * done / total if total else 100)
+        eta = f", ETA {(total - done) / rate:.0f}s" if rate else ""
+        self.progress_label.config(text=f"Rendering: {done}/{total} devices ({rate:,.1f}/s{eta})")
 
     def _generate_internet_router_config(self, output_dir: str, devices_to_configure=None):
-        internet_router = InternetRouter(Config.INTERNET_ROUTER_NAME, Config.INTERNET_ROUTER_AS)
-        
         # Use either the selected devices or all devices
         devices = devices_to_configure if devices_to_configure else self.devices
-        
-        for device in devices:
-            for wan in device.wan_interfaces:
-                net = NetworkAddress(f"{wan.ip} {wan.netmask}")
-                internet_router.add_interface(f"WAN-{device.name}", net, wan.gateway)
-    
-        config = InternetRouter.generate_config(internet_router)
-        output_file = Path(output_dir) / f"{Config.INTERNET_ROUTER_NAME}_config.txt"
-        with open(output_file, 'w') as f:
-            f.write(config)
+        pipeline.write_internet_router_config(devices, output_dir)
 
     def run(self):
         self.root.mainloop()
\ No newline at end of file
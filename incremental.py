@@ -0,0 +1,71 @@
+# incremental.py
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Set
+from models import Device
+from config import Config
+
+MANIFEST_NAME = ".mesh_manifest.json"
+# Bump whenever ConfigGenerator output changes so existing manifests are invalidated
+RENDER_VERSION = 1
+
+def config_fingerprint(compact: bool = False) -> str:
+    constants = sorted((name, value) for name, value in vars(Config).items() if name.isupper())
+    # The default mode keeps its original key so existing manifests stay valid
+    key = (RENDER_VERSION, constants, 'compact') if compact else (RENDER_VERSION, constants)
+    return hashlib.sha256(repr(key).encode()).hexdigest()
+
+def device_fingerprint(device: Device, config_hash: str) -> str:
+    digest = hashlib.sha256(config_hash.encode())
+    digest.update(repr((
+        device.name, device.site_id, device.location, device.is_hub, device.encryption_key,
+        device.bgp_as_numbers,
+        [(net.ip, net.netmask) for net in device.local_networks],
+        [(wan.name, wan.ip, wan.netmask, wan.gateway, wan.is_primary) for wan in device.wan_interfaces],
+    )).encode())
+    for tunnel in device.tunnel_interfaces:
+        digest.update(repr((
+            tunnel.name, tunnel.source_wan.name, tunnel.destination_wan.ip,
+            tunnel.local_ip, tunnel.remote_ip, tunnel.is_primary, tunnel.remote_as
+        )).encode())
+    return digest.hexdigest()
+
+class BuildManifest:
+    def __init__(self, output_dir: str, compact: bool = False):
+        self.path = Path(output_dir) / MANIFEST_NAME
+        self.config_hash = config_fingerprint(compact)
+        self.devices: Dict[str, str] = {}
+        self._previous: Dict[str, str] = {}
+        # Devices of the previous run even when its config hash no longer matches
+        self._previous_names: Set[str] = set()
+
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            self._previous_names = set(data.get('devices', {}))
+            if data.get('config') == self.config_hash:
+                self._previous = data.get('devices', {})
+        except (OSError, ValueError):
+            self._previous = {}
+
+    def fingerprint(self, device: Device) -> str:
+        return device_fingerprint(device, self.config_hash)
+
+    def is_current(self, device_name: str, fingerprint: str, output_file: Path) -> bool:
+        return self._previous.get(device_name) == fingerprint and output_file.exists()
+
+    def record(self, device_name: str, fingerprint: str):
+        self.devices[device_name] = fingerprint
+
+    def removed(self) -> List[str]:
+        # Devices the previous run wrote that were not recorded in this one
+        return sorted(self._previous_names - set(self.devices))
+
+    def save(self):
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({'config': self.config_hash, 'devices': self.devices}, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,154 @@
+# instrumentation.py
+#
+# Opt-in timers and counters for generation runs. Nothing is recorded unless
+# enable() has been called; instrumented code asks active() once per unit of work
+# and skips all bookkeeping when it returns None.
+
+import heapq
+import io
+import json
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterable, Iterator, Optional
+
+_active: Optional['Instrumentation'] = None
+_NULL_CONTEXT = nullcontext()
+
+class Instrumentation:
+    def __init__(self, profile: bool = False, trace_memory: bool = False, top_n: int = 10):
+        self.top_n = top_n
+        self.phases: Dict[str, Dict[str, float]] = {}
+        self.counters: Dict[str, int] = {}
+        self.devices: Dict[str, Dict[str, float]] = {}
+        self._started = time.perf_counter()
+        self._profiler = None
+        self._trace_memory = trace_memory
+        # The profiling modules are only loaded for runs that ask for them
+        if profile:
+            import cProfile
+            self._profiler = cProfile.Profile()
+
+    def start(self):
+        if self._trace_memory:
+            import tracemalloc
+            tracemalloc.start()
+        if self._profiler is not None:
+            self._profiler.enable()
+
+    def stop(self):
+        if self._profiler is not None:
+            self._profiler.disable()
+
+    def add_time(self, name: str, seconds: float, calls: int = 1):
+        phase = self.phases.get(name)
+        if phase is None:
+            phase = self.phases[name] = {'calls': 0, 'seconds': 0.0}
+        phase['calls'] += calls
+        phase['seconds'] += seconds
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def timed_iter(self, name: str, fragments: Iterable[str]) -> Iterator[str]:
+        # Only the time spent producing fragments is counted, not the consumer's writes
+        total = 0.0
+        iterator = iter(fragments)
+        while True:
+            start = time.perf_counter()
+            try:
+                fragment = next(iterator)
+            except StopIteration:
+                total += time.perf_counter() - start
+                break
+            total += time.perf_counter() - start
+            yield fragment
+        self.add_time(name, total)
+
+    def count(self, name: str, value: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def record_device(self, name: str, seconds: float, bytes_written: int):
+        self.devices[name] = {'seconds': seconds, 'bytes': bytes_written}
+        self.count('bytes_written', bytes_written)
+
+    def report(self) -> Dict:
+        slowest = heapq.nlargest(self.top_n, self.devices.items(), key=lambda item: item[1]['seconds'])
+        report = {
+            'total_seconds': round(time.perf_counter() - self._started, 6),
+            'phases': {name: {'calls': int(phase['calls']), 'seconds': round(phase['seconds'], 6)}
+                       for name, phase in sorted(self.phases.items())},
+            'counters': dict(sorted(self.counters.items())),
+            'devices': {name: {'seconds': round(stats['seconds'], 6), 'bytes': stats['bytes']}
+                        for name, stats in self.devices.items()},
+            'slowest_devices': [{'device': name, 'seconds': round(stats['seconds'], 6), 'bytes': stats['bytes']}
+                                for name, stats in slowest],
+        }
+
+        if self._trace_memory:
+            import tracemalloc
+
+            if tracemalloc.is_tracing():
+                current, peak = tracemalloc.get_traced_memory()
+                top = tracemalloc.take_snapshot().statistics('lineno')[:self.top_n]
+                report['memory'] = {
+                    'current_bytes': current,
+                    'peak_bytes': peak,
+                    'top_allocations': [{'location': str(stat.traceback), 'bytes': stat.size, 'count': stat.count}
+                                        for stat in top],
+                }
+
+        if self._profiler is not None:
+            import pstats
+
+            stream = io.StringIO()
+            pstats.Stats(self._profiler, stream=stream).sort_stats('cumulative').print_stats(self.top_n * 2)
+            report['profile'] = stream.getvalue().splitlines()
+        return report
+
+    def write_report(self, path: str):
+        self.stop()
+        report = self.report()
+        if self._profiler is not None:
+            self._profiler.dump_stats(f"{path}.prof")
+        if self._trace_memory:
+            import tracemalloc
+            tracemalloc.stop()
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+def enable(profile: bool = False, trace_memory: bool = False, top_n: int = 10) -> Instrumentation:
+    global _active
+    _active = Instrumentation(profile, trace_memory, top_n)
+    _active.start()
+    return _active
+
+def disable():
+    global _active
+    if _active is not None:
+        _active.stop()
+    _active = None
+
+def active() -> Optional[Instrumentation]:
+    return _active
+
+@contextmanager
+def suspended():
+    # Nothing is recorded inside the block, e.g. for renders that are not part of the output
+    global _active
+    metrics, _active = _active, None
+    try:
+        yield
+    finally:
+        _active = metrics
+
+def phase(name: str):
+    return _active.phase(name) if _active is not None else _NULL_CONTEXT
+
+def count(name: str, value: int = 1):
+    if _active is not None:
+        _active.count(name, value)
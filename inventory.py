@@ -0,0 +1,138 @@
+# inventory.py
+#
+# Single-pass inventory ingestion: headers are checked and rows are validated and
+# turned into Devices while the CSV is read once. Bad rows are collected with their
+# line numbers instead of aborting on the first one.
+
+import csv
+from dataclasses import dataclass
+from typing import Dict, Iterator, List
+from models import Device, NetworkAddress
+from utils import check_headers, ip_to_int
+import instrumentation
+
+# InventoryError messages list at most this many rows; the full list is on .errors
+MAX_REPORTED_ERRORS = 50
+
+@dataclass
+class RowError:
+    line: int
+    device: str
+    field: str
+    message: str
+
+    def __str__(self) -> str:
+        device = f" ({self.device})" if self.device else ""
+        return f"line {self.line}{device}: {self.field}: {self.message}"
+
+class InventoryError(ValueError):
+    def __init__(self, errors: List[RowError]):
+        self.errors = errors
+        lines = [str(error) for error in errors[:MAX_REPORTED_ERRORS]]
+        if len(errors) > MAX_REPORTED_ERRORS:
+            lines.append(f"... and {len(errors) - MAX_REPORTED_ERRORS} more")
+        super().__init__(f"{len(errors)} invalid inventory entries:\n" + "\n".join(lines))
+
+def _split(value: str) -> List[str]:
+    return Device._parse_csv_list(value or "")
+
+def validate_row(row: Dict) -> List[tuple]:
+    # Returns (field, message) pairs for problems Device() would choke on or silently
+    # get wrong, such as WAN lists of different lengths being truncated by zip().
+    # Addresses are checked separately by address_problems() since Device() parses them anyway.
+    problems = []
+    for field in ('device_name', 'site_id', 'location', 'wan_ips', 'wan_interfaces', 'wan_gateways',
+                  'bgp_as_number'):
+        if not (row.get(field) or "").strip():
+            problems.append((field, "missing value"))
+    if None in row:
+        problems.append(('row', f"{len(row[None])} more values than headers"))
+
+    try:
+        int(row.get('site_id') or "")
+    except ValueError:
+        if (row.get('site_id') or "").strip():
+            problems.append(('site_id', f"not an integer: {row['site_id']!r}"))
+
+    wan_ips = _split(row.get('wan_ips'))
+    wan_interfaces = _split(row.get('wan_interfaces'))
+    wan_gateways = _split(row.get('wan_gateways'))
+    if not (len(wan_ips) == len(wan_interfaces) == len(wan_gateways)):
+        problems.append(('wan_ips', f"{len(wan_ips)} wan_ips, {len(wan_interfaces)} wan_interfaces and "
+                                    f"{len(wan_gateways)} wan_gateways do not match"))
+
+    for gateway in wan_gateways:
+        try:
+            ip_to_int(gateway)
+        except ValueError:
+            problems.append(('wan_gateways', f"invalid address {gateway!r}"))
+
+    for field in ('bgp_as_number', 'bgp_neighbor_as'):
+        for value in _split(row.get(field)):
+            if not value.isdigit() or not 0 < int(value) < 2 ** 32:
+                problems.append((field, f"invalid AS number {value!r}"))
+    return problems
+
+def address_problems(row: Dict) -> List[tuple]:
+    problems = []
+    for field in ('wan_ips', 'local_networks'):
+        for value in _split(row.get(field)):
+            try:
+                NetworkAddress(value)
+            except ValueError as e:
+                problems.append((field, f"invalid address {value!r}: {e}"))
+    return problems
+
+class InventoryReader:
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.errors: List[RowError] = []
+        self.rows = 0
+
+    def __iter__(self) -> Iterator[Device]:
+        # Lazily yields a Device per valid row; invalid rows end up in self.errors
+        self.errors = []
+        self.rows = 0
+        first_seen: Dict[str, int] = {}
+        with open(self.file_path, 'r', newline='') as f:
+            reader = csv.DictReader(f)
+            with instrumentation.phase("validate_csv_headers"):
+                check_headers(reader.fieldnames)
+
+            for row in reader:
+                self.rows += 1
+                line = reader.line_num
+                name = (row.get('device_name') or "").strip()
+                problems = validate_row(row)
+                if name in first_seen:
+                    problems.append(('device_name', f"duplicate of line {first_seen[name]}"))
+                elif name:
+                    first_seen[name] = line
+
+                if problems:
+                    problems.extend(address_problems(row))
+                else:
+                    try:
+                        device = Device(row)
+                    except Exception as e:
+                        problems.extend(address_problems(row) or [('row', str(e))])
+                if problems:
+                    self.errors.extend(RowError(line, name, field, message) for field, message in problems)
+                    continue
+                yield device
+
+    def chunks(self, size: int = 1000) -> Iterator[List[Device]]:
+        chunk = []
+        for device in self:
+            chunk.append(device)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def load(self) -> List[Device]:
+        devices = list(self)
+        if self.errors:
+            raise InventoryError(self.errors)
+        return devices
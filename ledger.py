@@ -0,0 +1,88 @@
+# ledger.py
+
+import sqlite3
+from typing import Dict, List, Optional, Set, Tuple
+
+PairKey = Tuple[str, str]
+
+# Tunnel allocations keyed by the sorted WAN IP pair. Each entry holds the subnet
+# index handed out by TunnelAddressManager and the tunnel numbers used on the devices
+# owning the first and second WAN of the key. save() only writes new, changed and
+# removed pairs, and pairs not seen during a run are dropped so their subnets free up.
+class TunnelLedger:
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[PairKey, List[Optional[int]]] = {}
+        self.pool = None
+        self._seen: Set[PairKey] = set()
+        self._dirty: Set[PairKey] = set()
+
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS tunnels (
+                wan_a TEXT NOT NULL,
+                wan_b TEXT NOT NULL,
+                subnet_index INTEGER NOT NULL,
+                tunnel_a INTEGER,
+                tunnel_b INTEGER,
+                PRIMARY KEY (wan_a, wan_b)
+            ) WITHOUT ROWID;
+        """)
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'pool'").fetchone()
+        if row:
+            self.pool = row[0]
+        for wan_a, wan_b, subnet_index, tunnel_a, tunnel_b in self._conn.execute("SELECT * FROM tunnels"):
+            self.entries[(wan_a, wan_b)] = [subnet_index, tunnel_a, tunnel_b]
+
+    def bind_pool(self, pool: str):
+        if self.pool is not None and self.pool != pool:
+            raise ValueError(f"Tunnel ledger {self.path} was created for pool {self.pool}, not {pool}")
+        self.pool = pool
+
+    def used_subnets(self) -> Set[int]:
+        return {entry[0] for entry in self.entries.values()}
+
+    def lookup(self, key: PairKey) -> Optional[int]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        self._seen.add(key)
+        return entry[0]
+
+    def keep(self, key: PairKey):
+        # Marks a pair as still in use without looking it up
+        self._seen.add(key)
+
+    def record(self, key: PairKey, subnet_index: int):
+        self.entries[key] = [subnet_index, None, None]
+        self._seen.add(key)
+        self._dirty.add(key)
+
+    def tunnel_numbers(self, key: PairKey) -> Tuple[Optional[int], Optional[int]]:
+        entry = self.entries.get(key)
+        return (entry[1], entry[2]) if entry else (None, None)
+
+    def set_tunnel_numbers(self, key: PairKey, tunnel_a: int, tunnel_b: int):
+        entry = self.entries[key]
+        if entry[1] != tunnel_a or entry[2] != tunnel_b:
+            entry[1], entry[2] = tunnel_a, tunnel_b
+            self._dirty.add(key)
+
+    def save(self):
+        removed = [key for key in self.entries if key not in self._seen]
+        with self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('pool', ?)", (self.pool,))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO tunnels VALUES (?, ?, ?, ?, ?)",
+                [(key[0], key[1], *self.entries[key]) for key in self._dirty if key in self.entries]
+            )
+            self._conn.executemany("DELETE FROM tunnels WHERE wan_a = ? AND wan_b = ?", removed)
+        for key in removed:
+            del self.entries[key]
+        self._seen.clear()
+        self._dirty.clear()
+
+    def close(self):
+        self._conn.close()
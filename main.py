@@ -1,7 +1,12 @@
 # main.py
 
-from gui import Application
+import sys
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        from cli import main
+        sys.exit(main())
+
+    from gui import Application
     app = Application()
     app.run()
@@ -1,7 +1,8 @@
+import copy
 from dataclasses import dataclass
-from typing import List, Dict, Tuple
-from ipaddress import IPv4Network
+from typing import Iterator, List, Dict, Optional, TextIO, Tuple
 from config import Config
+from utils import aggregate_prefixes, int_to_ip, ip_to_int, netmask_to_prefix, prefix_to_netmask
 
 @dataclass
 class WanInterface:
@@ -26,15 +27,45 @@ class TunnelInterface:
     remote_as: str
 
 class NetworkAddress:
+    # Address and prefix are kept as integers; the first host and the network
+    # address are derived on first use and cached, so no ipaddress objects are built
+    __slots__ = ('ip', 'netmask', 'ip_int', 'prefix_length', '_network_address', '_first_host')
+
     def __init__(self, address_string: str):
         if '/' in address_string:
             ip, prefix = address_string.split('/')
             self.ip = ip.strip()
-            self.netmask = str(IPv4Network(f"0.0.0.0/{prefix}").netmask)
+            prefix = prefix.strip()
+            # The suffix may also be a dotted netmask, as in 10.0.0.0/255.255.255.0
+            self.prefix_length = int(prefix) if prefix.isdigit() else netmask_to_prefix(prefix)
+            if not 0 <= self.prefix_length <= 32:
+                raise ValueError(f"Invalid prefix length in {address_string.strip()}")
+            self.netmask = prefix_to_netmask(self.prefix_length)
         else:
             parts = address_string.strip().split()
             self.ip = parts[0]
             self.netmask = parts[1] if len(parts) > 1 else "255.255.255.0"
+            self.prefix_length = netmask_to_prefix(self.netmask)
+        self.ip_int = ip_to_int(self.ip)
+        self._network_address = None
+        self._first_host = None
+
+    @property
+    def netmask_int(self) -> int:
+        return (0xFFFFFFFF << (32 - self.prefix_length)) & 0xFFFFFFFF
+
+    @property
+    def network_int(self) -> int:
+        return self.ip_int & self.netmask_int
+
+    @property
+    def broadcast_int(self) -> int:
+        return self.network_int | (~self.netmask_int & 0xFFFFFFFF)
+
+    @property
+    def prefix_netmask(self) -> str:
+        # Normalized netmask, even when the inventory gave a host mask
+        return prefix_to_netmask(self.prefix_length)
 
     @property
     def network(self) -> str:
@@ -42,16 +73,31 @@ class NetworkAddress:
 
     @property
     def network_address(self) -> str:
-        return str(IPv4Network(f"{self.ip}/{self.netmask}", strict=False).network_address)
+        if self._network_address is None:
+            self._network_address = int_to_ip(self.network_int)
+        return self._network_address
+
+    @property
+    def first_host(self) -> str:
+        # Same address IPv4Network.hosts() would return first: /31 and /32 have no
+        # reserved network address
+        if self._first_host is None:
+            offset = 1 if self.prefix_length < 31 else 0
+            self._first_host = int_to_ip(self.network_int + offset)
+        return self._first_host
 
 class Device:
     def __init__(self, row: Dict):
         self.name = row['device_name']
         self.site_id = int(row['site_id'])
         self.location = row['location']
+        # Optional region column; sites without one are grouped by location
+        self.region = (row.get('region') or '').strip() or self.location
         self.is_hub = False
         self._track_counter = Config.TRACK_BASE
         self._tunnel_counter = 0
+        self._reserved_tunnel_numbers = set()
+        self._used_tunnel_numbers = set()
         self.base_tunnel_number = (self.site_id * 100) % 10000
 
         self.wan_interfaces = []
@@ -82,18 +128,62 @@ class Device:
     def _parse_csv_list(value: str) -> List[str]:
         return [item.strip() for item in value.split(',') if item.strip()]
 
-    def generate_tunnel_name(self) -> str:
+    def reset_tunnels(self):
+        # Back to the freshly parsed state so the device can go through another build
+        self.is_hub = False
+        self.tunnel_interfaces = []
+        self._tunnel_counter = 0
+        self._reserved_tunnel_numbers = set()
+        self._used_tunnel_numbers = set()
+
+    def fork(self) -> 'Device':
+        # Cheap copy for building another topology from the same parsed inventory: the
+        # parsed fields (WANs, networks, AS lists) are shared read-only and only the
+        # state a build writes is new
+        device = copy.copy(self)
+        device.reset_tunnels()
+        return device
+
+    def update_from(self, other: 'Device'):
+        # Take over other's inventory fields but keep this device's tunnels, for edits
+        # that do not change the tunnel graph
+        for name, value in vars(other).items():
+            if name not in ('is_hub', 'tunnel_interfaces', '_tunnel_counter', '_reserved_tunnel_numbers',
+                            '_used_tunnel_numbers'):
+                setattr(self, name, value)
+
+    def reserve_tunnel_number(self, tunnel_number: int):
+        self._reserved_tunnel_numbers.add(tunnel_number)
+
+    def use_tunnel_number(self, tunnel_number: int):
+        self._used_tunnel_numbers.add(tunnel_number)
+
+    def claim_tunnel_number(self, tunnel_number: Optional[int]) -> int:
+        # Takes a remembered number unless this build already gave it to another tunnel
+        # on this device, in which case a fresh one is handed out
+        if tunnel_number is None or tunnel_number in self._used_tunnel_numbers:
+            return self.next_tunnel_number()
+        self._used_tunnel_numbers.add(tunnel_number)
+        return tunnel_number
+
+    def next_tunnel_number(self) -> int:
         tunnel_number = self.base_tunnel_number + self._tunnel_counter
+        while tunnel_number in self._reserved_tunnel_numbers or tunnel_number in self._used_tunnel_numbers:
+            self._tunnel_counter += 1
+            tunnel_number = self.base_tunnel_number + self._tunnel_counter
         if tunnel_number > 10000:
             raise ValueError(f"Tunnel number {tunnel_number} exceeds maximum allowed value of 10000")
-        tunnel_name = f"tunnel{tunnel_number}"
         self._tunnel_counter += 1
-        return tunnel_name
+        self._used_tunnel_numbers.add(tunnel_number)
+        return tunnel_number
+
+    def generate_tunnel_name(self) -> str:
+        return f"tunnel{self.next_tunnel_number()}"
 
     def get_local_network_address(self) -> Tuple[str, str]:
         if self.local_networks:
-            network = IPv4Network(f"{self.local_networks[0].ip}/{self.local_networks[0].netmask}", strict=False)
-            return str(list(network.hosts())[0]), str(network.netmask)
+            network = self.local_networks[0]
+            return network.first_host, network.prefix_netmask
         return None, None
 
     def generate_track_id(self) -> int:
@@ -102,44 +192,86 @@ class Device:
         return track_id
     
 class InternetRouter:
-    def __init__(self, name: str, as_number: str):
+    # aggregate announces the smallest set of blocks covering the WAN networks instead
+    # of one network statement per WAN, with a Null0 route to originate each block
+    def __init__(self, name: str, as_number: str, aggregate: bool = False):
         self.name = name
         self.as_number = as_number
+        self.aggregate = aggregate
         self.interfaces = []
+        self.peers = []
 
     def add_interface(self, name: str, network: NetworkAddress, gateway: str):
         self.interfaces.append({
             'name': name,
             'ip': gateway,
             'netmask': network.netmask,
-            'network': network.ip
+            'network': network.ip,
+            'first': network.network_int,
+            'last': network.broadcast_int,
+        })
+
+    def add_peer(self, name: str, local_ip: str, remote_ip: str, remote_as: str, netmask: str):
+        # eBGP link to another internet router shard
+        self.peers.append({
+            'name': name,
+            'ip': local_ip,
+            'remote_ip': remote_ip,
+            'remote_as': remote_as,
+            'netmask': netmask,
         })
 
     @staticmethod
     def generate_config(router: 'InternetRouter') -> str:
-        config = f"""!
+        return "".join(InternetRouter.iter_config(router))
+
+    @staticmethod
+    def write_config(router: 'InternetRouter', stream: TextIO):
+        stream.writelines(InternetRouter.iter_config(router))
+
+    @staticmethod
+    def iter_config(router: 'InternetRouter') -> Iterator[str]:
+        yield f"""!
 ! Configuration for {router.name}
 ! AS Number: {router.as_number}
 !
 """
         # Interface configuration
         for idx, intf in enumerate(router.interfaces, 1):
-            config += f"""
+            yield f"""
 interface GigabitEthernet0/{idx}
  description WAN Interface for {intf['network']}
  ip address {intf['ip']} {intf['netmask']}
  no shutdown
 """
         
+        for idx, peer in enumerate(router.peers, 1):
+            yield f"""
+interface GigabitEthernet1/{idx}
+ description Shard link to {peer['name']}
+ ip address {peer['ip']} {peer['netmask']}
+ no shutdown
+"""
+
         # BGP configuration
-        config += f"""
+        yield f"""
 router bgp {router.as_number}
  bgp log-neighbor-changes
  bgp bestpath compare-routerid
 """
         
+        for peer in router.peers:
+            yield f" neighbor {peer['remote_ip']} remote-as {peer['remote_as']}\n"
+
         # Add networks to BGP
-        for intf in router.interfaces:
-            config += f" network {intf['network']} mask {intf['netmask']}\n"
-            
-        return config
\ No newline at end of file
+        if not router.aggregate:
+            for intf in router.interfaces:
+                yield f" network {intf['network']} mask {intf['netmask']}\n"
+            return
+
+        blocks = aggregate_prefixes((intf['first'], intf['last']) for intf in router.interfaces)
+        for network, prefix_length in blocks:
+            yield f" network {int_to_ip(network)} mask {prefix_to_netmask(prefix_length)}\n"
+        yield "\n"
+        for network, prefix_length in blocks:
+            yield f"ip route {int_to_ip(network)} {prefix_to_netmask(prefix_length)} Null0\n"
@@ -1,96 +1,459 @@
 # network.py
 
-from typing import List, Optional, Tuple
+import hashlib
+from math import ceil
+from threading import Event
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Union
+from bisect import bisect_right
+from heapq import heappop
 from itertools import product
+from time import perf_counter
 from ipaddress import IPv4Network
-from models import Device, TunnelInterface, WanInterface
+from models import Device, WanInterface
+from tunnels import TunnelTable
 from config import Config, NetworkTopology
+from utils import int_to_ip, prefix_to_netmask
+import instrumentation
+
+if TYPE_CHECKING:
+    from ledger import TunnelLedger
+
+# Device pairs processed between progress callbacks / cancel checks in NetworkBuilder.build
+PROGRESS_INTERVAL = 256
+# A hub takes at most this multiple of the average spokes per hub in assign_hubs
+HUB_BALANCE_FACTOR = 1.25
+
+class BuildCancelled(Exception):
+    pass
 
 class TunnelAddressManager:
-    def __init__(self, network: str = Config.TUNNEL_NETWORK):
-        self.base_network = IPv4Network(network)
-        self.subnets = list(self.base_network.subnets(new_prefix=29))
+    def __init__(self, network: Union[str, Sequence[str]] = Config.TUNNEL_NETWORK,
+                 ledger: Optional['TunnelLedger'] = None):
+        # The prefix length comes from Config, as RenderContext renders the tunnel netmask from it
+        prefix_length = Config.TUNNEL_PREFIX_LENGTH
+        if prefix_length > 31:
+            raise ValueError(f"Tunnel prefix length /{prefix_length} leaves no room for a tunnel pair")
+
+        pools = network.split(",") if isinstance(network, str) else list(network)
+        self.prefix_length = prefix_length
+        self.subnet_size = 1 << (32 - prefix_length)
+        self.netmask = prefix_to_netmask(prefix_length)
+        # /31 uses both addresses, everything else skips the network address
+        self._host_offset = 0 if prefix_length == 31 else 1
+
+        # Pools are kept as (first subnet index, network address) so the Nth subnet is
+        # found with a bisect over the pool list instead of a materialized subnet list
+        self.pools = []
+        self._pool_starts = []
+        self._pool_networks = []
+        self.capacity = 0
+        for pool in pools:
+            base_network = IPv4Network(pool.strip())
+            if base_network.prefixlen > prefix_length:
+                raise ValueError(f"Tunnel pool {base_network} is smaller than a /{prefix_length}")
+            self.pools.append(str(base_network))
+            self._pool_starts.append(self.capacity)
+            self._pool_networks.append(int(base_network.network_address))
+            self.capacity += 1 << (prefix_length - base_network.prefixlen)
+
         self.current_subnet_index = 0
         self.allocated_pairs = {}
+        self.ledger = ledger
+        self._free_subnets = []
+        if ledger is not None:
+            ledger.bind_pool(f"{','.join(self.pools)}/{prefix_length}")
+            used = ledger.used_subnets()
+            self.current_subnet_index = max(used) + 1 if used else 0
+            self._free_subnets = [i for i in range(self.current_subnet_index) if i not in used]
 
-    def get_tunnel_pair(self, wan1: str, wan2: str) -> Tuple[str, str]:
-        key = tuple(sorted([wan1, wan2]))
-        
-        if key in self.allocated_pairs:
-            pair = self.allocated_pairs[key]
-            return (pair[0], pair[1]) if wan1 == key[0] else (pair[1], pair[0])
+    def subnet_address(self, index: int) -> int:
+        if not 0 <= index < self.capacity:
+            raise IndexError(f"Tunnel subnet index {index} is outside the pool")
+        pool = bisect_right(self._pool_starts, index) - 1
+        return self._pool_networks[pool] + (index - self._pool_starts[pool]) * self.subnet_size
 
-        if self.current_subnet_index >= len(self.subnets):
+    def subnet_hosts(self, index: int) -> Tuple[str, str]:
+        first = self.subnet_address(index) + self._host_offset
+        return int_to_ip(first), int_to_ip(first + 1)
+
+    def _next_subnet_index(self) -> int:
+        # Reuse subnets freed by pairs removed from the ledger before growing the pool
+        if self._free_subnets:
+            return heappop(self._free_subnets)
+
+        if self.current_subnet_index >= self.capacity:
             raise ValueError("No more tunnel IP addresses available!")
 
-        subnet = self.subnets[self.current_subnet_index]
-        hosts = list(subnet.hosts())
+        subnet_index = self.current_subnet_index
         self.current_subnet_index += 1
+        return subnet_index
+
+    def get_tunnel_pair(self, wan1: str, wan2: str) -> Tuple[str, str]:
+        local_ip, remote_ip = self.get_tunnel_pair_ints(wan1, wan2)
+        return int_to_ip(local_ip), int_to_ip(remote_ip)
+
+    def get_tunnel_pair_ints(self, wan1: str, wan2: str) -> Tuple[int, int]:
+        key = (wan1, wan2) if wan1 <= wan2 else (wan2, wan1)
+
+        # Only the subnet index is kept per pair; addresses are recomputed on demand
+        subnet_index = self.allocated_pairs.get(key)
+        if subnet_index is None:
+            subnet_index = self.ledger.lookup(key) if self.ledger is not None else None
+            if subnet_index is None:
+                subnet_index = self._next_subnet_index()
+                if self.ledger is not None:
+                    self.ledger.record(key, subnet_index)
+            self.allocated_pairs[key] = subnet_index
 
-        pair = (str(hosts[0]), str(hosts[1]))
-        self.allocated_pairs[key] = pair
-        
-        return pair if wan1 == key[0] else (pair[1], pair[0])
+        first = self.subnet_address(subnet_index) + self._host_offset
+        return (first, first + 1) if wan1 == key[0] else (first + 1, first)
 
 class NetworkBuilder:
-    def __init__(self, devices: List[Device], topology_type: str, hub_sites: Optional[List[str]] = None):
+    def __init__(self, devices: List[Device], topology_type: str, hub_sites: Optional[List[str]] = None,
+                 tunnel_manager: Optional[TunnelAddressManager] = None,
+                 edges: Optional[Iterable[Tuple[str, str]]] = None):
         self.devices = devices
         self.topology_type = topology_type
         self.hub_sites = hub_sites or []
-        self.tunnel_manager = TunnelAddressManager()
+        self.edges = edges
+        self.tunnel_manager = tunnel_manager or TunnelAddressManager()
+        self._named_pairs = set()
+        self.tunnels = TunnelTable(devices)
+        self._get_tunnel_pair = self.tunnel_manager.get_tunnel_pair_ints
 
         if topology_type == NetworkTopology.HUB_SPOKE and not hub_sites:
             raise ValueError("Hub sites must be specified for hub-spoke topology")
+        if topology_type == NetworkTopology.EDGE_LIST and edges is None:
+            raise ValueError("An edge list must be specified for edge list topology")
 
-        for device in self.devices:
-            device.is_hub = device.name in self.hub_sites
+        if topology_type == NetworkTopology.REGIONAL:
+            self.hub_sites = regional_hubs(devices, self.hub_sites)
+        hub_names = set(self.hub_sites)
+        for index, device in enumerate(self.devices):
+            # Devices may come from an earlier build (a second GUI run or a retry after
+            # cancel); start their tunnel numbering over
+            device.reset_tunnels()
+            device.is_hub = device.name in hub_names
+            device.tunnel_interfaces = self.tunnels.view(index)
 
-    def build(self):
-        if self.topology_type == NetworkTopology.FULL_MESH:
-            self._create_full_mesh()
-        else:
-            self._create_hub_spoke()
+        if self.tunnel_manager.ledger is not None:
+            self._reserve_ledger_tunnel_numbers()
+
+    def build(self, progress: Optional[Callable[[int], None]] = None, cancel: Optional[Event] = None):
+        # progress receives the number of tunnels built so far; cancel is polled at the
+        # same interval and aborts the build with ledger changes left unsaved
+        metrics = instrumentation.active()
+        if metrics is not None:
+            self._get_tunnel_pair = self._timed_tunnel_pair(metrics)
+
+        for count, (device1, device2) in enumerate(self.iter_edges(), 1):
+            self._create_device_pair_tunnels(device1, device2)
+            if count % PROGRESS_INTERVAL == 0 and (progress is not None or cancel is not None):
+                if cancel is not None and cancel.is_set():
+                    raise BuildCancelled("Network build cancelled")
+                if progress is not None:
+                    progress(len(self.tunnels))
+        if progress is not None:
+            progress(len(self.tunnels))
+
+        if self.tunnel_manager.ledger is not None:
+            self.tunnel_manager.ledger.save()
+
+    def build_from(self, previous: 'NetworkBuilder', previous_hubs: Iterable[str]) -> Set[int]:
+        # Build after an inventory edit. Device pairs whose Device objects both come
+        # from previous copy its tunnel rows; only pairs involving a new or replaced
+        # device are created. Subnets and tunnel numbers of recreated pairs come back
+        # from the ledger, so the result matches a full build. previous_hubs are the
+        # hub names of previous, captured before this builder reset is_hub. Returns
+        # the indices of devices whose tunnels or hub role changed.
+        ledger = self.tunnel_manager.ledger
+        if ledger is None:
+            # Without a ledger copied rows could collide with new allocations
+            self.build()
+            return set(range(len(self.devices)))
+
+        old = previous.tunnels
+        old_rows: Dict[Tuple[int, int], List[int]] = {}
+        for row, (device_a, device_b) in enumerate(zip(old.device_a, old.device_b)):
+            key = (device_a, device_b) if device_a < device_b else (device_b, device_a)
+            old_rows.setdefault(key, []).append(row)
+
+        old_index = {id(device): index for index, device in enumerate(previous.devices)}
+        affected = {index for index, device in enumerate(self.devices) if id(device) not in old_index}
+        kept = set()
+        for device1, device2 in self.iter_edges():
+            index1 = self.tunnels.index_of(device1)
+            index2 = self.tunnels.index_of(device2)
+            old1 = old_index.get(id(device1))
+            old2 = old_index.get(id(device2))
+            key = (old1, old2) if old1 is not None and old2 is not None and old1 < old2 else (old2, old1)
+            rows = old_rows.get(key) if old1 is not None and old2 is not None else None
+            if rows is None:
+                self._create_device_pair_tunnels(device1, device2)
+                affected.update((index1, index2))
+                continue
+
+            kept.add(key)
+            for row in rows:
+                if old.device_a[row] == old1:
+                    self.tunnels.add_from(old, row, index1, index2)
+                    device1.use_tunnel_number(old.tunnel_a[row])
+                    device2.use_tunnel_number(old.tunnel_b[row])
+                else:
+                    self.tunnels.add_from(old, row, index2, index1)
+                    device2.use_tunnel_number(old.tunnel_a[row])
+                    device1.use_tunnel_number(old.tunnel_b[row])
+                wan1 = previous.devices[old.device_a[row]].wan_interfaces[old.wan_a[row]].ip
+                wan2 = previous.devices[old.device_b[row]].wan_interfaces[old.wan_b[row]].ip
+                ledger.keep((wan1, wan2) if wan1 <= wan2 else (wan2, wan1))
+
+        # Devices left at either end of a removed pair lose its tunnels
+        new_index = {id(device): index for index, device in enumerate(self.devices)}
+        for old_pair in old_rows.keys() - kept:
+            for old_device_index in old_pair:
+                index = new_index.get(id(previous.devices[old_device_index]))
+                if index is not None:
+                    affected.add(index)
+
+        previous_hubs = set(previous_hubs)
+        affected.update(index for index, device in enumerate(self.devices)
+                        if device.is_hub != (device.name in previous_hubs))
+        ledger.save()
+        return affected
+
+    def _timed_tunnel_pair(self, metrics):
+        get_tunnel_pair = self.tunnel_manager.get_tunnel_pair_ints
 
-    def _create_full_mesh(self):
-        for device1, device2 in product(self.devices, self.devices):
+        def timed(wan1: str, wan2: str) -> Tuple[int, int]:
+            start = perf_counter()
+            try:
+                return get_tunnel_pair(wan1, wan2)
+            finally:
+                metrics.add_time("tunnel_manager.get_tunnel_pair", perf_counter() - start)
+        return timed
+
+    def _reserve_ledger_tunnel_numbers(self):
+        # Keep numbers recorded in the ledger away from newly generated tunnel names
+        wan_owners = {wan.ip: device for device in self.devices for wan in device.wan_interfaces}
+        for (wan_a, wan_b), (_, tunnel_a, tunnel_b) in self.tunnel_manager.ledger.entries.items():
+            for wan_ip, tunnel_number in ((wan_a, tunnel_a), (wan_b, tunnel_b)):
+                if tunnel_number is not None and wan_ip in wan_owners:
+                    wan_owners[wan_ip].reserve_tunnel_number(tunnel_number)
+
+    def _tunnel_numbers(self, device1: Device, wan1: WanInterface, device2: Device, wan2: WanInterface) -> Tuple[int, int]:
+        ledger = self.tunnel_manager.ledger
+        key = (wan1.ip, wan2.ip) if wan1.ip <= wan2.ip else (wan2.ip, wan1.ip)
+        if ledger is None or key in self._named_pairs:
+            return device1.next_tunnel_number(), device2.next_tunnel_number()
+
+        self._named_pairs.add(key)
+        numbers = ledger.tunnel_numbers(key)
+        stored1, stored2 = numbers if key[0] == wan1.ip else numbers[::-1]
+        # Stored numbers follow the WAN IP, which may have moved to another device since
+        # the ledger was written; a number that device already uses is replaced
+        number1, number2 = device1.claim_tunnel_number(stored1), device2.claim_tunnel_number(stored2)
+        if (number1, number2) != (stored1, stored2):
+            ledger.set_tunnel_numbers(key, *((number1, number2) if key[0] == wan1.ip else (number2, number1)))
+        return number1, number2
+
+    def iter_edges(self) -> Iterator[Tuple[Device, Device]]:
+        return self.topology_edges(self.devices, self.topology_type, self.hub_sites, self.edges)
+
+    @staticmethod
+    def topology_edges(devices: List[Device], topology_type: str, hub_sites: Optional[List[str]] = None,
+                       edges: Optional[Iterable[Tuple[str, str]]] = None) -> Iterator[Tuple[Device, Device]]:
+        # Every topology reduces to a stream of device pairs; tunnels are only created
+        # for the pairs yielded here. Nothing is mutated, so the planner can use it too.
+        if topology_type in (NetworkTopology.FULL_MESH, NetworkTopology.PEER_TO_PEER):
+            return NetworkBuilder._full_mesh_edges(devices)
+        if topology_type == NetworkTopology.HUB_SPOKE:
+            return NetworkBuilder._hub_spoke_edges(devices, hub_sites or [], edges)
+        if topology_type == NetworkTopology.EDGE_LIST:
+            return NetworkBuilder._edge_list_edges(devices, edges or [])
+        if topology_type == NetworkTopology.REGIONAL:
+            return NetworkBuilder._regional_edges(devices, regional_hubs(devices, hub_sites))
+        raise ValueError(f"Unknown topology: {topology_type}")
+
+    @staticmethod
+    def _full_mesh_edges(devices: List[Device]) -> Iterator[Tuple[Device, Device]]:
+        for device1, device2 in product(devices, devices):
             if device1.name >= device2.name:
                 continue
-            self._create_device_pair_tunnels(device1, device2)
+            yield device1, device2
 
-    def _create_hub_spoke(self):
-        hub_devices = [d for d in self.devices if d.is_hub]
-        spoke_devices = [d for d in self.devices if not d.is_hub]
+    @staticmethod
+    def _hub_spoke_edges(devices: List[Device], hub_sites: List[str],
+                         assignments: Optional[Iterable[Tuple[str, str]]] = None) -> Iterator[Tuple[Device, Device]]:
+        # assignments, when given, are the (hub, spoke) pairs from assign_hubs;
+        # otherwise every spoke connects to every hub
+        hub_names = set(hub_sites)
+        hub_devices = [d for d in devices if d.name in hub_names]
+        spoke_devices = [d for d in devices if d.name not in hub_names]
 
-        for hub1, hub2 in product(hub_devices, hub_devices):
-            if hub1.name >= hub2.name:
+        yield from NetworkBuilder._full_mesh_edges(hub_devices)
+        if assignments is None:
+            yield from product(hub_devices, spoke_devices)
+            return
+
+        devices_by_name = {device.name: device for device in devices}
+        for hub_name, spoke_name in assignments:
+            if hub_name not in hub_names:
+                raise ValueError(f"Assignment {hub_name} - {spoke_name} does not start at a hub")
+            if spoke_name not in devices_by_name or spoke_name in hub_names:
+                raise ValueError(f"Assignment {hub_name} - {spoke_name} does not end at a spoke")
+            yield devices_by_name[hub_name], devices_by_name[spoke_name]
+
+    @staticmethod
+    def _regional_edges(devices: List[Device], hub_sites: List[str]) -> Iterator[Tuple[Device, Device]]:
+        # Regional hubs form the backbone mesh and every other site only peers with
+        # the hubs of its own region, so hubs carry O(hubs + region size) tunnels
+        hub_names = set(hub_sites)
+        hub_devices = [d for d in devices if d.name in hub_names]
+        yield from NetworkBuilder._full_mesh_edges(hub_devices)
+
+        regions = {}
+        for device in devices:
+            hubs, spokes = regions.setdefault(device.region, ([], []))
+            (hubs if device.name in hub_names else spokes).append(device)
+        for hubs, spokes in regions.values():
+            yield from product(hubs, spokes)
+
+    @staticmethod
+    def _edge_list_edges(devices: List[Device], edges: Iterable[Tuple[str, str]]) -> Iterator[Tuple[Device, Device]]:
+        # Work is proportional to the number of edges; duplicates and self-loops are
+        # dropped and each pair is oriented by name like the full mesh
+        devices_by_name = {device.name: device for device in devices}
+        seen = set()
+        for name1, name2 in edges:
+            if name1 == name2:
+                continue
+            key = (name1, name2) if name1 < name2 else (name2, name1)
+            if key in seen:
                 continue
-            self._create_device_pair_tunnels(hub1, hub2)
+            seen.add(key)
 
-        for hub, spoke in product(hub_devices, spoke_devices):
-            self._create_device_pair_tunnels(hub, spoke)
+            unknown = [name for name in key if name not in devices_by_name]
+            if unknown:
+                raise ValueError(f"Edge {name1} - {name2} references unknown device {', '.join(unknown)}")
+            yield devices_by_name[key[0]], devices_by_name[key[1]]
 
     def _create_device_pair_tunnels(self, device1: Device, device2: Device):
-        for wan1, wan2 in product(device1.wan_interfaces, device2.wan_interfaces):
-            local_ip, remote_ip = self.tunnel_manager.get_tunnel_pair(wan1.ip, wan2.ip)
-            
-            device1.tunnel_interfaces.append(TunnelInterface(
-                name=device1.generate_tunnel_name(),
-                source_wan=wan1,
-                destination_wan=wan2,
-                local_ip=local_ip,
-                remote_ip=remote_ip,
-                is_primary=wan1.is_primary and wan2.is_primary,
-                remote_device=device2.name,
-                remote_as=device2.bgp_as_numbers[0]
-            ))
-            
-            device2.tunnel_interfaces.append(TunnelInterface(
-                name=device2.generate_tunnel_name(),
-                source_wan=wan2,
-                destination_wan=wan1,
-                local_ip=remote_ip,
-                remote_ip=local_ip,
-                is_primary=wan1.is_primary and wan2.is_primary,
-                remote_device=device1.name,
-                remote_as=device1.bgp_as_numbers[0]
-            ))
\ No newline at end of file
+        index1 = self.tunnels.index_of(device1)
+        index2 = self.tunnels.index_of(device2)
+        for (wan_index1, wan1), (wan_index2, wan2) in product(enumerate(device1.wan_interfaces),
+                                                              enumerate(device2.wan_interfaces)):
+            local_ip, remote_ip = self._get_tunnel_pair(wan1.ip, wan2.ip)
+            number1, number2 = self._tunnel_numbers(device1, wan1, device2, wan2)
+            self.tunnels.add(index1, wan_index1, local_ip, number1, index2, wan_index2, remote_ip, number2)
+
+def _rendezvous_weight(spoke_name: str, hub_name: str) -> int:
+    # Stable across runs and processes, unlike hash()
+    return int.from_bytes(hashlib.blake2b(f"{spoke_name}|{hub_name}".encode(), digest_size=8).digest(), "big")
+
+def assign_hubs(devices: List[Device], hub_sites: List[str], hubs_per_spoke: int,
+                hub_capacity: Optional[Dict[str, int]] = None,
+                previous: Optional[Iterable[Tuple[str, str]]] = None) -> List[Tuple[str, str]]:
+    # Connects each spoke to hubs_per_spoke hubs instead of all of them and returns the
+    # (hub, spoke) pairs for the hub-spoke topology, grouped by hub in device order.
+    # Every spoke ranks the hubs by a rendezvous hash of (spoke, hub). A hub is skipped
+    # while it holds HUB_BALANCE_FACTOR times its share of spokes, or when the spoke's
+    # tunnels would take it past hub_capacity (total tunnels, including the hub mesh);
+    # the balance bound is waived before a spoke is left short of hubs.
+    # Without capacity limits a spoke's choice does not depend on the other spokes. With
+    # them, spokes placed first can fill a hub, so previous, the (hub, spoke) pairs of an
+    # earlier run, is placed first: those spokes keep their hubs wherever they still fit
+    # and new spokes cannot displace them.
+    hub_names = set(hub_sites)
+    hubs = [d for d in devices if d.name in hub_names]
+    spokes = [d for d in devices if d.name not in hub_names]
+    if not hubs:
+        raise ValueError("Hub sites must be specified for hub-spoke topology")
+    if hubs_per_spoke < 1:
+        raise ValueError("Each spoke needs at least one hub")
+    hubs_per_spoke = min(hubs_per_spoke, len(hubs))
+    hub_capacity = hub_capacity or {}
+
+    hub_wans = sum(len(hub.wan_interfaces) for hub in hubs)
+    tunnels = {hub.name: len(hub.wan_interfaces) * (hub_wans - len(hub.wan_interfaces)) for hub in hubs}
+    spoke_counts = {hub.name: 0 for hub in hubs}
+    balance_bound = ceil(HUB_BALANCE_FACTOR * len(spokes) * hubs_per_spoke / len(hubs))
+    for hub in hubs:
+        limit = hub_capacity.get(hub.name)
+        if limit is not None and tunnels[hub.name] > limit:
+            raise ValueError(f"Hub {hub.name} needs {tunnels[hub.name]} tunnels for the hub mesh alone, "
+                             f"over its capacity of {limit}")
+
+    previous_hubs: Dict[str, set] = {}
+    for hub_name, spoke_name in previous or ():
+        previous_hubs.setdefault(spoke_name, set()).add(hub_name)
+
+    assigned = {}
+    for spoke in sorted(spokes, key=lambda d: (d.name not in previous_hubs, d.name)):
+        ranked = sorted(hubs, key=lambda hub: _rendezvous_weight(spoke.name, hub.name), reverse=True)
+        fits = []
+        for hub in ranked:
+            limit = hub_capacity.get(hub.name)
+            needed = len(spoke.wan_interfaces) * len(hub.wan_interfaces)
+            if limit is None or tunnels[hub.name] + needed <= limit:
+                fits.append(hub)
+        kept = previous_hubs.get(spoke.name, ())
+        chosen = [hub for hub in fits if hub.name in kept][:hubs_per_spoke]
+        chosen += [hub for hub in fits if hub not in chosen
+                   and spoke_counts[hub.name] < balance_bound][:hubs_per_spoke - len(chosen)]
+        if len(chosen) < hubs_per_spoke:
+            chosen += [hub for hub in fits if hub not in chosen][:hubs_per_spoke - len(chosen)]
+        if len(chosen) < hubs_per_spoke:
+            raise ValueError(f"Only {len(chosen)} of {hubs_per_spoke} hubs have capacity left for {spoke.name}")
+
+        for hub in chosen:
+            tunnels[hub.name] += len(spoke.wan_interfaces) * len(hub.wan_interfaces)
+            spoke_counts[hub.name] += 1
+        assigned[spoke.name] = {hub.name for hub in chosen}
+
+    spokes_by_hub: Dict[str, List[str]] = {hub.name: [] for hub in hubs}
+    for spoke in spokes:
+        for hub_name in assigned[spoke.name]:
+            spokes_by_hub[hub_name].append(spoke.name)
+    return [(hub.name, spoke_name) for hub in hubs for spoke_name in spokes_by_hub[hub.name]]
+
+def regional_hubs(devices: List[Device], hub_sites: Optional[List[str]] = None,
+                  per_region: int = Config.REGIONAL_HUBS) -> List[str]:
+    # Hub names for the regional topology. Regions that contain one of hub_sites keep
+    # exactly those hubs; the others get their per_region lowest site IDs. Already
+    # resolved lists come back unchanged, so callers may resolve up front.
+    chosen = set(hub_sites or [])
+    regions = {}
+    for device in devices:
+        regions.setdefault(device.region, []).append(device)
+
+    hubs = []
+    for members in regions.values():
+        explicit = [d.name for d in members if d.name in chosen]
+        if explicit:
+            hubs.extend(explicit)
+        else:
+            members = sorted(members, key=lambda d: (d.site_id, d.name))
+            hubs.extend(d.name for d in members[:per_region])
+    return hubs
+
+def regional_mesh_edges(devices: List[Device], neighbors: Optional[int] = None) -> Iterator[Tuple[str, str]]:
+    # Partial mesh rule for edge list topology. Sites are grouped by region; inside a
+    # region every site peers with the next `neighbors` sites (all of them when None),
+    # and the lowest site ID of each region joins a backbone mesh with the other regions.
+    regions = {}
+    for device in devices:
+        regions.setdefault(device.region, []).append(device)
+
+    anchors = []
+    for members in regions.values():
+        members = sorted(members, key=lambda d: (d.site_id, d.name))
+        anchors.append(members[0])
+        count = len(members)
+        reach = count - 1 if neighbors is None else min(neighbors, count - 1)
+        for i, device in enumerate(members):
+            for offset in range(1, reach + 1):
+                yield device.name, members[(i + offset) % count].name
+
+    for i, anchor1 in enumerate(anchors):
+        for anchor2 in anchors[i + 1:]:
+            yield anchor1.name, anchor2.name
@@ -0,0 +1,70 @@
+# overlaps.py
+#
+# Inventory-wide address checks. Every prefix (local networks, WAN subnets and the
+# tunnel pools) becomes an integer interval; one sort and a sweep groups intervals
+# that overlap, so thousands of sites are checked in O(n log n) instead of pairwise.
+
+from dataclasses import dataclass
+from ipaddress import IPv4Network
+from typing import Iterator, List, Sequence, Tuple, Union
+from models import Device, NetworkAddress
+from config import Config
+
+# Prefixes listed per conflict; the count is always reported in full
+MAX_LISTED_PREFIXES = 10
+
+@dataclass
+class AddressConflict:
+    kind: str  # 'overlap' or 'duplicate_wan_ip'
+    # "<owner> <what> <prefix>" descriptions of everything involved
+    members: List[str]
+
+    def __str__(self) -> str:
+        listed = self.members[:MAX_LISTED_PREFIXES]
+        more = f" and {len(self.members) - len(listed)} more" if len(self.members) > len(listed) else ""
+        if self.kind == 'duplicate_wan_ip':
+            return f"Duplicate WAN IP on {', '.join(listed)}{more}"
+        return f"Overlapping prefixes: {', '.join(listed)}{more}"
+
+def _intervals(devices: List[Device], tunnel_pools: Sequence[str]) -> Iterator[Tuple[int, int, str]]:
+    for pool in tunnel_pools:
+        network = IPv4Network(pool.strip())
+        yield int(network.network_address), int(network.broadcast_address), f"tunnel pool {network}"
+
+    for device in devices:
+        for network in device.local_networks:
+            yield (network.network_int, network.broadcast_int,
+                   f"{device.name} local network {network.network_address}/{network.prefix_length}")
+        for wan in device.wan_interfaces:
+            network = NetworkAddress(f"{wan.ip} {wan.netmask}")
+            yield (network.network_int, network.broadcast_int,
+                   f"{device.name} {wan.name} {network.network_address}/{network.prefix_length}")
+
+def find_address_conflicts(devices: List[Device],
+                           tunnel_pools: Union[str, Sequence[str]] = Config.TUNNEL_NETWORK) -> List[AddressConflict]:
+    # Returns every duplicate WAN IP and every group of overlapping prefixes. Chained
+    # overlaps (A with B, B with C) are reported as one group, which keeps the output
+    # linear even when many sites reuse the same prefix.
+    if isinstance(tunnel_pools, str):
+        tunnel_pools = tunnel_pools.split(",")
+    conflicts = []
+
+    wan_owners = {}
+    for device in devices:
+        for wan in device.wan_interfaces:
+            wan_owners.setdefault(wan.ip, []).append(f"{device.name} {wan.name} {wan.ip}")
+    conflicts.extend(AddressConflict('duplicate_wan_ip', owners)
+                     for owners in wan_owners.values() if len(owners) > 1)
+
+    group: List[str] = []
+    group_end = -1
+    for start, end, label in sorted(_intervals(devices, tunnel_pools)):
+        if start > group_end:
+            if len(group) > 1:
+                conflicts.append(AddressConflict('overlap', group))
+            group = []
+        group.append(label)
+        group_end = max(group_end, end)
+    if len(group) > 1:
+        conflicts.append(AddressConflict('overlap', group))
+    return conflicts
@@ -0,0 +1,329 @@
+# pipeline.py
+
+import math
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from ipaddress import IPv4Network
+from pathlib import Path
+from threading import Event
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from models import Device, NetworkAddress, InternetRouter
+from network import (BuildCancelled, NetworkBuilder, TunnelAddressManager, assign_hubs, regional_hubs,
+                     regional_mesh_edges)
+from incremental import BuildManifest
+from sinks import DirectorySink, OutputSink
+from generators import ConfigGenerator, RenderContext
+from config import Config, NetworkTopology
+from utils import int_to_ip, load_edge_list
+from inventory import InventoryReader
+from snapshot import InventorySnapshot
+import instrumentation
+
+class GenerationCancelled(BuildCancelled):
+    pass
+
+def _check_cancel(cancel: Optional[Event]):
+    if cancel is not None and cancel.is_set():
+        raise GenerationCancelled("Generation cancelled")
+
+def load_devices(csv_file: str, use_snapshot: bool = False) -> List[Device]:
+    # Raises InventoryError listing every bad row, not just the first one. With
+    # use_snapshot the parsed devices are reused from the CSV's snapshot while the
+    # CSV is unchanged, and the snapshot is refreshed after a full parse.
+    snapshot = InventorySnapshot(csv_file) if use_snapshot else None
+    devices = None
+    if snapshot is not None:
+        with instrumentation.phase("load_snapshot"):
+            devices = snapshot.load()
+            if devices is None:
+                snapshot.key()
+    if devices is None:
+        with instrumentation.phase("parse_devices"):
+            devices = InventoryReader(csv_file).load()
+        if snapshot is not None:
+            with instrumentation.phase("save_snapshot"):
+                snapshot.save(devices)
+    instrumentation.count("devices", len(devices))
+    return devices
+
+def select_devices(devices: List[Device], topology: str, selected: Optional[List[str]] = None) -> List[Device]:
+    # For peer-to-peer, only use selected devices
+    if topology == NetworkTopology.PEER_TO_PEER:
+        selected = selected or []
+        return [d for d in devices if d.name in selected]
+    return devices
+
+def topology_edges(devices: List[Device], edge_file: Optional[str] = None,
+                   regional_neighbors: Optional[int] = None) -> List[Tuple[str, str]]:
+    # Materialized so the pre-flight planner and the build can both walk it
+    edges = []
+    if edge_file:
+        edges = list(load_edge_list(edge_file))
+    if regional_neighbors is not None:
+        edges.extend(regional_mesh_edges(devices, regional_neighbors or None))
+    return edges
+
+def resolve_topology(devices: List[Device], topology: str, hub_sites: Optional[List[str]] = None,
+                     selected: Optional[List[str]] = None, edge_file: Optional[str] = None,
+                     regional_neighbors: Optional[int] = None, hubs_per_spoke: Optional[int] = None,
+                     hub_capacity: Optional[Dict[str, int]] = None,
+                     regional_hub_count: int = Config.REGIONAL_HUBS,
+                     previous_edges: Optional[Iterable[Tuple[str, str]]] = None) -> Tuple[List[Device], Optional[List[str]], Optional[list]]:
+    # Turns topology options into the (devices, hub sites, edges) NetworkBuilder takes.
+    # Names must exist in the inventory; a typo would otherwise build without that site.
+    # previous_edges are the (hub, spoke) pairs of an earlier run, kept where capacity allows.
+    known = {device.name for device in devices}
+    for option, names in (("hub", hub_sites or []), ("device", selected or []),
+                          ("hub capacity", hub_capacity or {})):
+        unknown = [name for name in names if name not in known]
+        if unknown:
+            raise ValueError(f"Unknown {option} name{'s' if len(unknown) > 1 else ''} "
+                             f"not in the inventory: {', '.join(unknown)}")
+    devices_to_configure = select_devices(devices, topology, selected)
+    edges = None
+    if topology == NetworkTopology.EDGE_LIST:
+        edges = topology_edges(devices_to_configure, edge_file, regional_neighbors)
+    if topology == NetworkTopology.HUB_SPOKE and hubs_per_spoke is not None:
+        edges = assign_hubs(devices_to_configure, hub_sites, hubs_per_spoke, hub_capacity, previous_edges)
+    if topology == NetworkTopology.REGIONAL:
+        if regional_hub_count < 1:
+            raise ValueError("Each region needs at least one hub")
+        hub_sites = regional_hubs(devices_to_configure, hub_sites, regional_hub_count)
+    return devices_to_configure, hub_sites, edges
+
+def ledger_hub_assignments(ledger_path: str, devices: List[Device],
+                           hub_sites: Optional[List[str]]) -> List[Tuple[str, str]]:
+    # The (hub, spoke) pairs recorded in a ledger by an earlier run, found through the
+    # WAN IPs of its pairs; empty when the ledger does not exist yet
+    if not os.path.exists(ledger_path):
+        return []
+    from ledger import TunnelLedger
+
+    owners = {wan.ip: device.name for device in devices for wan in device.wan_interfaces}
+    hubs = set(hub_sites or [])
+    pairs = set()
+    ledger = TunnelLedger(ledger_path)
+    try:
+        for wan_a, wan_b in ledger.entries:
+            name_a, name_b = owners.get(wan_a), owners.get(wan_b)
+            if name_a is None or name_b is None or (name_a in hubs) == (name_b in hubs):
+                continue
+            pairs.add((name_a, name_b) if name_a in hubs else (name_b, name_a))
+    finally:
+        ledger.close()
+    return sorted(pairs)
+
+def build_network(devices: List[Device], topology: str, hub_sites: Optional[List[str]] = None,
+                  ledger_path: Optional[str] = None,
+                  edges: Optional[Iterable[Tuple[str, str]]] = None,
+                  progress: Optional[Callable[[int], None]] = None,
+                  cancel: Optional[Event] = None) -> NetworkBuilder:
+    tunnel_manager = None
+    if ledger_path:
+        # sqlite3 is only loaded for runs that keep a ledger
+        from ledger import TunnelLedger
+        tunnel_manager = TunnelAddressManager(ledger=TunnelLedger(ledger_path))
+    network_builder = NetworkBuilder(devices, topology, hub_sites, tunnel_manager, edges)
+    try:
+        with instrumentation.phase("build"):
+            network_builder.build(progress, cancel)
+    finally:
+        if tunnel_manager is not None:
+            tunnel_manager.ledger.close()
+    instrumentation.count("tunnels_created", len(network_builder.tunnels))
+    instrumentation.count("subnets_consumed", len(network_builder.tunnel_manager.allocated_pairs))
+    return network_builder
+
+def _render_timed(devices: List[Device], context: RenderContext) -> Iterator[Tuple[str, float]]:
+    for device in devices:
+        start = time.perf_counter()
+        config = ConfigGenerator.generate_device_config(device, context)
+        yield config, time.perf_counter() - start
+
+# Devices and render options of the current render_devices call, set in each worker
+# by _init_render_worker. Under fork they are inherited rather than pickled, so only
+# index ranges travel to the workers and only configs travel back.
+_render_devices: List[Device] = []
+_render_options: Tuple[bool, bool] = (False, False)
+
+def _init_render_worker(devices: List[Device], compact: bool, timed: bool):
+    global _render_devices, _render_options
+    _render_devices = devices
+    _render_options = (compact, timed)
+    # Forked workers inherit the parent's instrumentation, but nothing they record
+    # would make it back
+    instrumentation.disable()
+
+def _render_chunk(start: int, stop: int) -> Tuple[List[Tuple[str, float]], Dict[str, Dict[str, float]]]:
+    # With timing on, the chunk records into a fresh Instrumentation and returns its
+    # phases with the rendered configs so the parent can merge them
+    compact, timed = _render_options
+    metrics = instrumentation.enable() if timed else None
+    try:
+        rendered = list(_render_timed(_render_devices[start:stop], RenderContext(compact)))
+    finally:
+        instrumentation.disable()
+    return rendered, metrics.phases if metrics is not None else {}
+
+def render_devices(devices: List[Device], workers: int = 1, compact: bool = False) -> Iterator[Tuple[int, str, float]]:
+    # Yields (index into devices, config, render seconds) in device order. With more than
+    # one worker the devices are rendered in chunks on a process pool; chunks that finish
+    # early are held back so the output order never depends on scheduling.
+    if workers <= 1 or len(devices) < 2:
+        for index, (config, seconds) in enumerate(_render_timed(devices, RenderContext(compact))):
+            yield index, config, seconds
+        return
+
+    # The process pool machinery is only loaded for parallel runs
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    metrics = instrumentation.active()
+    chunk_size = max(1, math.ceil(len(devices) / (workers * 4)))
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_render_worker,
+                                   initargs=(devices, compact, metrics is not None))
+    try:
+        starts = list(range(0, len(devices), chunk_size))
+        futures = {executor.submit(_render_chunk, start, start + chunk_size): start for start in starts}
+        finished = {}
+        next_chunk = 0
+        for future in as_completed(futures):
+            finished[futures[future]] = future.result()
+            while next_chunk < len(starts) and starts[next_chunk] in finished:
+                start = starts[next_chunk]
+                rendered, phases = finished.pop(start)
+                next_chunk += 1
+                if metrics is not None:
+                    for name, phase in phases.items():
+                        metrics.add_time(name, phase['seconds'], phase['calls'])
+                for offset, (config, seconds) in enumerate(rendered):
+                    yield start + offset, config, seconds
+    finally:
+        # Drop queued chunks if the consumer stopped early (cancel or error)
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def write_device_configs(devices: List[Device], output: Union[str, OutputSink], incremental: bool = False,
+                         workers: int = 1, progress: Optional[Callable[[int, int], None]] = None,
+                         cancel: Optional[Event] = None, compact: bool = False) -> List[Union[Path, str]]:
+    # output is a directory path or an OutputSink; a path keeps the one-file-per-device layout.
+    # In incremental mode devices whose fingerprint matches the manifest are neither
+    # rendered nor rewritten. Returns the sink entries actually written, in device order.
+    sink = DirectorySink(output) if isinstance(output, str) else output
+    manifest = None
+    if incremental:
+        if not isinstance(sink, DirectorySink):
+            raise ValueError("Incremental mode needs a directory output")
+        manifest = BuildManifest(str(sink.output_dir), compact)
+
+    pending = []
+    for device in devices:
+        if manifest is not None:
+            fingerprint = manifest.fingerprint(device)
+            manifest.record(device.name, fingerprint)
+            if manifest.is_current(device.name, fingerprint, sink.path_for(device.name)):
+                continue
+        pending.append(device)
+
+    metrics = instrumentation.active()
+    started = time.perf_counter()
+    written = {}
+    if workers <= 1:
+        # Stream each config straight into the sink so memory stays bounded by one device
+        context = RenderContext(compact)
+        for index, device in enumerate(pending):
+            _check_cancel(cancel)
+            start = time.perf_counter()
+            with sink.open_config(device.name) as f:
+                ConfigGenerator.write_device_config(device, f, context)
+            written[index] = sink.entries[-1]
+            if metrics is not None:
+                metrics.record_device(device.name, time.perf_counter() - start, sink.sizes[device.name])
+            if progress is not None:
+                progress(len(written), len(pending))
+    else:
+        for index, config, render_seconds in render_devices(pending, workers, compact):
+            _check_cancel(cancel)
+            start = time.perf_counter()
+            sink.write_config(pending[index].name, config)
+            written[index] = sink.entries[-1]
+            if metrics is not None:
+                # Rendered in a worker; count its render time along with the write
+                metrics.record_device(pending[index].name, render_seconds + time.perf_counter() - start,
+                                      sink.sizes[pending[index].name])
+            if progress is not None:
+                progress(len(written), len(pending))
+
+    if manifest is not None:
+        # A config left behind by a removed device would look current
+        for name in manifest.removed():
+            try:
+                sink.path_for(name).unlink()
+            except OSError:
+                pass
+        manifest.save()
+    if metrics is not None:
+        metrics.add_time("write_device_configs", time.perf_counter() - started)
+        metrics.count("devices_written", len(written))
+        metrics.count("devices_unchanged", len(devices) - len(pending))
+    return [written[index] for index in sorted(written)]
+
+def build_internet_routers(devices: List[Device], shards: int = 1, aggregate: bool = False) -> List[InternetRouter]:
+    # One router terminates every WAN unless shards > 1. Shards take contiguous runs of
+    # sites, which keeps their WAN networks adjacent for aggregation, and each pair of
+    # shards gets a /31 eBGP link from Config.INTERNET_ROUTER_MESH_NETWORK.
+    if shards < 1:
+        raise ValueError("At least one internet router is needed")
+    if shards == 1:
+        routers = [InternetRouter(Config.INTERNET_ROUTER_NAME, Config.INTERNET_ROUTER_AS, aggregate)]
+    else:
+        routers = [InternetRouter(f"{Config.INTERNET_ROUTER_NAME}-{shard}",
+                                  str(Config.INTERNET_ROUTER_SHARD_AS_BASE + shard), aggregate)
+                   for shard in range(1, shards + 1)]
+
+    for index, device in enumerate(devices):
+        router = routers[index * shards // len(devices)]
+        for wan in device.wan_interfaces:
+            net = NetworkAddress(f"{wan.ip} {wan.netmask}")
+            router.add_interface(f"WAN-{device.name}", net, wan.gateway)
+
+    mesh = IPv4Network(Config.INTERNET_ROUTER_MESH_NETWORK)
+    links = shards * (shards - 1) // 2
+    if links * 2 > mesh.num_addresses:
+        raise ValueError(f"{shards} internet router shards need {links} /31 links, more than "
+                         f"{Config.INTERNET_ROUTER_MESH_NETWORK} holds")
+    link = int(mesh.network_address)
+    for i, router1 in enumerate(routers):
+        for router2 in routers[i + 1:]:
+            ip1, ip2 = int_to_ip(link), int_to_ip(link + 1)
+            router1.add_peer(router2.name, ip1, ip2, router2.as_number, "255.255.255.254")
+            router2.add_peer(router1.name, ip2, ip1, router1.as_number, "255.255.255.254")
+            link += 2
+    return routers
+
+def write_internet_router_configs(devices: List[Device], output: Union[str, OutputSink], shards: int = 1,
+                                  aggregate: bool = False) -> List[Union[Path, str]]:
+    sink = DirectorySink(output) if isinstance(output, str) else output
+    written = []
+    with instrumentation.phase("internet_router"):
+        for router in build_internet_routers(devices, shards, aggregate):
+            with sink.open_config(router.name) as f:
+                InternetRouter.write_config(router, f)
+            written.append(sink.entries[-1])
+    return written
+
+def write_internet_router_config(devices: List[Device], output: Union[str, OutputSink]) -> Union[Path, str]:
+    return write_internet_router_configs(devices, output)[0]
+
+@contextmanager
+def staged_output(output_dir: str) -> Iterator[str]:
+    # Files are written to a hidden staging directory and only moved into output_dir
+    # once everything succeeded, so a cancelled or failed run leaves no partial set behind
+    staging_dir = tempfile.mkdtemp(prefix=".mesh-partial-", dir=output_dir)
+    try:
+        yield staging_dir
+        for name in sorted(os.listdir(staging_dir)):
+            os.replace(os.path.join(staging_dir, name), os.path.join(output_dir, name))
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
@@ -0,0 +1,203 @@
+# planner.py
+#
+# Pre-flight capacity planning. Everything here is computed from the inventory and
+# the topology alone, in O(devices + edges), without allocating tunnels, subnets or
+# tunnel numbers, so an oversized topology is rejected before the build starts.
+# Overlapping prefixes and duplicate WAN IPs (overlaps.py) are reported as errors too.
+
+import copy
+from bisect import bisect_right
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+from models import Device
+from network import NetworkBuilder, TunnelAddressManager
+from generators import ConfigGenerator, RenderContext
+from overlaps import find_address_conflicts
+from config import NetworkTopology
+
+MAX_TUNNEL_NUMBER = 10000
+COLLISIONS_LISTED = 100
+
+# Rough costs measured on the benchmark inventories; only used for the estimates
+BYTES_PER_TUNNEL_PAIR = 160
+BUILD_PAIRS_PER_SECOND = 150_000
+RENDER_TUNNELS_PER_SECOND = 50_000
+
+@dataclass
+class DevicePlan:
+    name: str
+    site_id: int
+    wan_count: int
+    tunnel_count: int
+    first_tunnel_number: int
+    last_tunnel_number: int
+    estimated_bytes: int
+
+@dataclass
+class CapacityPlan:
+    topology: str
+    devices: List[DevicePlan] = field(default_factory=list)
+    tunnel_pairs: int = 0
+    subnets_available: int = 0
+    estimated_bytes: int = 0
+    estimated_memory_bytes: int = 0
+    estimated_seconds: float = 0.0
+    collision_count: int = 0
+    # At most COLLISIONS_LISTED example pairs
+    collisions: List[Tuple[str, str]] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+    warnings: List[str] = field(default_factory=list)
+
+    @property
+    def tunnel_interfaces(self) -> int:
+        return 2 * self.tunnel_pairs
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def to_dict(self) -> Dict:
+        plan = asdict(self)
+        plan["tunnel_interfaces"] = self.tunnel_interfaces
+        plan["collisions"] = [list(pair) for pair in self.collisions]
+        return plan
+
+    def summary(self) -> str:
+        busiest = max(self.devices, key=lambda d: d.tunnel_count, default=None)
+        lines = [
+            f"Topology: {self.topology}, {len(self.devices)} devices",
+            f"Tunnel pairs: {self.tunnel_pairs} ({self.tunnel_interfaces} tunnel interfaces)",
+            f"Tunnel subnets: {self.tunnel_pairs} needed, {self.subnets_available} available",
+        ]
+        if busiest is not None:
+            lines.append(f"Busiest device: {busiest.name} with {busiest.tunnel_count} tunnels "
+                         f"(tunnel{busiest.first_tunnel_number}-tunnel{busiest.last_tunnel_number})")
+        lines.append(f"Tunnel number range collisions: {self.collision_count}")
+        lines.append(f"Estimated output: {self.estimated_bytes / 1e6:.1f} MB, "
+                     f"build memory: {self.estimated_memory_bytes / 1e6:.1f} MB, "
+                     f"time: {self.estimated_seconds:.1f}s")
+        lines.extend(f"Warning: {warning}" for warning in self.warnings)
+        lines.extend(f"Error: {error}" for error in self.errors)
+        return "\n".join(lines)
+
+def plan_capacity(devices: List[Device], topology: str, hub_sites: Optional[List[str]] = None,
+                  edges: Optional[Iterable[Tuple[str, str]]] = None,
+                  tunnel_manager: Optional[TunnelAddressManager] = None, compact: bool = False) -> CapacityPlan:
+    plan = CapacityPlan(topology)
+    tunnel_manager = tunnel_manager or TunnelAddressManager()
+    plan.subnets_available = tunnel_manager.capacity
+    plan.errors.extend(str(conflict) for conflict in find_address_conflicts(devices, tunnel_manager.pools))
+
+    try:
+        counts = _tunnel_counts(devices, topology, hub_sites, edges)
+    except ValueError as e:
+        plan.errors.append(str(e))
+        return plan
+
+    if topology in (NetworkTopology.HUB_SPOKE, NetworkTopology.REGIONAL):
+        names = {device.name for device in devices}
+        missing = [name for name in hub_sites or [] if name not in names]
+        if missing:
+            plan.warnings.append(f"Hub sites not in the inventory: {', '.join(missing)}")
+
+    # Every tunnel is counted on both ends
+    plan.tunnel_pairs = sum(counts) // 2
+    if plan.tunnel_pairs > plan.subnets_available:
+        plan.errors.append(f"Topology needs {plan.tunnel_pairs} tunnel subnets but the pool "
+                           f"{','.join(tunnel_manager.pools)} only has {plan.subnets_available} "
+                           f"/{tunnel_manager.prefix_length}s")
+
+    context = RenderContext(compact)
+    as_length = max((len(device.bgp_as_numbers[0]) for device in devices if device.bgp_as_numbers), default=5)
+    for device, count in zip(devices, counts):
+        first = device.base_tunnel_number
+        last = first + count - 1
+        plan.devices.append(DevicePlan(device.name, device.site_id, len(device.wan_interfaces), count,
+                                       first, last, _estimate_config_bytes(device, count, last, as_length, context)))
+        if last > MAX_TUNNEL_NUMBER:
+            plan.errors.append(f"{device.name} needs tunnel numbers {first}-{last}, "
+                               f"past the maximum of {MAX_TUNNEL_NUMBER}")
+
+    plan.collision_count, plan.collisions = _range_collisions(plan.devices)
+    if plan.collision_count:
+        plan.warnings.append(f"{plan.collision_count} device pairs share tunnel number ranges "
+                             f"(site_id * 100 wraps at {MAX_TUNNEL_NUMBER})")
+
+    plan.estimated_bytes = sum(device.estimated_bytes for device in plan.devices)
+    plan.estimated_memory_bytes = plan.tunnel_pairs * BYTES_PER_TUNNEL_PAIR
+    plan.estimated_seconds = (plan.tunnel_pairs / BUILD_PAIRS_PER_SECOND
+                              + plan.tunnel_interfaces / RENDER_TUNNELS_PER_SECOND)
+    return plan
+
+def _tunnel_counts(devices: List[Device], topology: str, hub_sites: Optional[List[str]],
+                   edges: Optional[Iterable[Tuple[str, str]]]) -> List[int]:
+    # Tunnels per device, in device order. Meshes are counted from WAN totals; edge
+    # lists, hub assignments and inventories with repeated names walk the device pairs.
+    if topology == NetworkTopology.HUB_SPOKE and not hub_sites:
+        raise ValueError("Hub sites must be specified for hub-spoke topology")
+    if topology == NetworkTopology.EDGE_LIST and edges is None:
+        raise ValueError("An edge list must be specified for edge list topology")
+
+    wans = [len(device.wan_interfaces) for device in devices]
+    unique_names = len({device.name for device in devices}) == len(devices)
+    if unique_names and topology in (NetworkTopology.FULL_MESH, NetworkTopology.PEER_TO_PEER):
+        total = sum(wans)
+        return [w * (total - w) for w in wans]
+
+    if unique_names and topology == NetworkTopology.HUB_SPOKE and edges is None:
+        hub_names = set(hub_sites)
+        hubs = [device.name in hub_names for device in devices]
+        hub_wans = sum(w for w, is_hub in zip(wans, hubs) if is_hub)
+        spoke_wans = sum(wans) - hub_wans
+        return [w * (hub_wans - w) + w * spoke_wans if is_hub else w * hub_wans
+                for w, is_hub in zip(wans, hubs)]
+
+    index = {id(device): i for i, device in enumerate(devices)}
+    counts = [0] * len(devices)
+    for device1, device2 in NetworkBuilder.topology_edges(devices, topology, hub_sites, edges):
+        i, j = index[id(device1)], index[id(device2)]
+        pairs = wans[i] * wans[j]
+        counts[i] += pairs
+        counts[j] += pairs
+    return counts
+
+def _estimate_config_bytes(device: Device, tunnels: int, last_tunnel_number: int, as_length: int,
+                           context: RenderContext) -> int:
+    # The fixed part is rendered exactly from a tunnel-less copy; each tunnel adds an
+    # interface, a tunnel group and a neighbor block, sized here with the widest values.
+    # Compact output adds the peer-group definitions once and has one tunnel group per
+    # remote address, i.e. per tunnel from a single local WAN.
+    stub = copy.copy(device)
+    stub.tunnel_interfaces = []
+    fixed = len(ConfigGenerator.generate_device_config(stub, context))
+    if not tunnels:
+        return fixed
+
+    address = "255.255.255.255"
+    name = f"tunnel{max(last_tunnel_number, 0)}"
+    nameif = max((context.wan_nameif(wan.name) for wan in device.wan_interfaces), key=len)
+    tunnel_interface = len(context.tunnel_template(name, device.location, address, nameif, address))
+    tunnel_group = len(context.tunnel_group_template(address, device.encryption_key))
+    if not context.compact:
+        neighbor = len(context.neighbor_templates[False](address, "9" * as_length))
+        return fixed + tunnels * (tunnel_interface + tunnel_group + neighbor)
+
+    neighbor = len(context.peer_group_member_templates[False](address, "9" * as_length))
+    tunnel_groups = -(-tunnels // max(len(device.wan_interfaces), 1))
+    return (fixed + sum(len(definition) for definition in context.peer_group_definitions.values())
+            + tunnels * (tunnel_interface + neighbor) + tunnel_groups * tunnel_group)
+
+def _range_collisions(devices: List[DevicePlan], limit: int = COLLISIONS_LISTED) -> Tuple[int, List[Tuple[str, str]]]:
+    # Ranges sorted by start overlap a range exactly when their start falls inside it,
+    # so the count is one bisect per device; only the first `limit` pairs are listed
+    # because wrapped site IDs can make nearly every pair collide
+    ranges = sorted((d.first_tunnel_number, d.last_tunnel_number, d.name) for d in devices if d.tunnel_count)
+    starts = [first for first, _, _ in ranges]
+    count = 0
+    examples = []
+    for i, (first, last, name) in enumerate(ranges):
+        end = bisect_right(starts, last)
+        count += end - i - 1
+        for other in ranges[i + 1:min(end, i + 1 + limit - len(examples))]:
+            examples.append((name, other[2]))
+    return count, examples
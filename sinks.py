@@ -0,0 +1,222 @@
+# sinks.py
+#
+# Destinations for rendered configs. DirectorySink keeps the historical
+# <device>_config.txt layout; the archive sinks put every config into one
+# tar/zip file or an NDJSON bundle so large runs do not create thousands of files.
+# tarfile and zipfile are imported where used so directory output does not load them.
+
+import io
+import json
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, TextIO, Tuple, Union
+
+CONFIG_SUFFIX = "_config.txt"
+# Fixed member timestamp so the same configs always produce the same archive;
+# SOURCE_DATE_EPOCH overrides it as in other reproducible builds
+ARCHIVE_MTIME = int(os.environ.get('SOURCE_DATE_EPOCH', 315532800))  # 1980-01-01, the zip epoch
+
+def config_file_name(device_name: str) -> str:
+    return f"{device_name}{CONFIG_SUFFIX}"
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("zstd compression requires the 'zstandard' package")
+    return zstandard
+
+class OutputSink:
+    def __init__(self):
+        # Entries in write order and the number of bytes written for each device
+        self.entries: List[Union[Path, str]] = []
+        self.sizes: Dict[str, int] = {}
+
+    @contextmanager
+    def open_config(self, device_name: str) -> Iterator[TextIO]:
+        raise NotImplementedError
+
+    def write_config(self, device_name: str, config: str):
+        with self.open_config(device_name) as f:
+            f.write(config)
+
+    def close(self):
+        pass
+
+    def __enter__(self) -> 'OutputSink':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class DirectorySink(OutputSink):
+    def __init__(self, output_dir: str):
+        super().__init__()
+        self.output_dir = Path(output_dir)
+
+    def path_for(self, device_name: str) -> Path:
+        return self.output_dir / config_file_name(device_name)
+
+    @contextmanager
+    def open_config(self, device_name: str) -> Iterator[TextIO]:
+        output_file = self.path_for(device_name)
+        with open(output_file, 'w') as f:
+            yield f
+            self.sizes[device_name] = f.tell()
+        self.entries.append(output_file)
+
+class TarSink(OutputSink):
+    # Streams a tar archive; compression is None, 'gz' or 'zst'. Each member is
+    # buffered on its own because tar headers carry the size up front.
+    def __init__(self, path: str, compression: str = None):
+        import tarfile
+
+        super().__init__()
+        self.path = path
+        zstandard = _zstandard() if compression == 'zst' else None
+        self._file = open(path, 'wb')
+        self._compressor = None
+        if zstandard is not None:
+            self._compressor = zstandard.ZstdCompressor().stream_writer(self._file)
+        elif compression == 'gz':
+            # tarfile's own gzip stream stamps the current time into the header
+            import gzip
+            self._compressor = gzip.GzipFile(filename='', mode='wb', fileobj=self._file, mtime=ARCHIVE_MTIME)
+        self._tar = tarfile.open(fileobj=self._compressor or self._file, mode='w|')
+
+    @contextmanager
+    def open_config(self, device_name: str) -> Iterator[TextIO]:
+        import tarfile
+
+        buffer = io.BytesIO()
+        stream = io.TextIOWrapper(buffer, encoding='utf-8', newline='')
+        yield stream
+        stream.flush()
+        info = tarfile.TarInfo(config_file_name(device_name))
+        info.size = buffer.tell()
+        info.mtime = ARCHIVE_MTIME
+        buffer.seek(0)
+        self._tar.addfile(info, buffer)
+        stream.detach()
+        self.sizes[device_name] = info.size
+        self.entries.append(info.name)
+
+    def close(self):
+        self._tar.close()
+        if self._compressor is not None:
+            self._compressor.close()
+        if not self._file.closed:
+            self._file.close()
+
+class ZipSink(OutputSink):
+    def __init__(self, path: str, compression: Optional[int] = None):
+        # compression defaults to ZIP_DEFLATED
+        import zipfile
+
+        super().__init__()
+        self.path = path
+        compression = zipfile.ZIP_DEFLATED if compression is None else compression
+        self._zip = zipfile.ZipFile(path, 'w', compression=compression)
+
+    @contextmanager
+    def open_config(self, device_name: str) -> Iterator[TextIO]:
+        import zipfile
+
+        name = config_file_name(device_name)
+        info = zipfile.ZipInfo(name, date_time=time.gmtime(ARCHIVE_MTIME)[:6])
+        info.compress_type = self._zip.compression
+        with self._zip.open(info, 'w') as member:
+            stream = io.TextIOWrapper(member, encoding='utf-8', newline='')
+            yield stream
+            stream.flush()
+            stream.detach()
+        self.sizes[device_name] = self._zip.getinfo(name).file_size
+        self.entries.append(name)
+
+    def close(self):
+        self._zip.close()
+
+class NdjsonSink(OutputSink):
+    # One {"device": ..., "config": ...} object per line, plus a <path>.idx JSON
+    # index of {device: [offset, length]} so a single config can be read with one seek
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self.index: Dict[str, Tuple[int, int]] = {}
+        self._file = open(path, 'wb')
+
+    @contextmanager
+    def open_config(self, device_name: str) -> Iterator[TextIO]:
+        stream = io.StringIO()
+        yield stream
+        config = stream.getvalue()
+        line = json.dumps({'device': device_name, 'config': config}).encode() + b"\n"
+        self.index[device_name] = (self._file.tell(), len(line))
+        self._file.write(line)
+        self.sizes[device_name] = len(config.encode())
+        self.entries.append(device_name)
+
+    def close(self):
+        self._file.close()
+        with open(f"{self.path}.idx", 'w') as f:
+            json.dump(self.index, f)
+
+def open_sink(path: str) -> OutputSink:
+    # Picks the archive sink from the file extension
+    name = path.lower()
+    if name.endswith(('.tar.gz', '.tgz')):
+        return TarSink(path, 'gz')
+    if name.endswith(('.tar.zst', '.tzst')):
+        return TarSink(path, 'zst')
+    if name.endswith('.tar'):
+        return TarSink(path)
+    if name.endswith('.zip'):
+        return ZipSink(path)
+    if name.endswith(('.ndjson', '.jsonl')):
+        return NdjsonSink(path)
+    raise ValueError(f"Unsupported archive format: {path} (use .tar, .tar.gz, .tar.zst, .zip or .ndjson)")
+
+def read_bundle_config(path: str, device_name: str) -> str:
+    with open(f"{path}.idx", 'r') as f:
+        offset, length = json.load(f)[device_name]
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        return json.loads(f.read(length))['config']
+
+def _device_name(member_name: str) -> str:
+    name = os.path.basename(member_name)
+    return name[:-len(CONFIG_SUFFIX)] if name.endswith(CONFIG_SUFFIX) else name
+
+def read_configs(path: str) -> Iterator[Tuple[str, str]]:
+    # Yields (device name, config) from any layout the sinks above can write
+    name = path.lower()
+    if os.path.isdir(path):
+        for entry in sorted(os.listdir(path)):
+            if entry.endswith(CONFIG_SUFFIX):
+                with open(os.path.join(path, entry), 'r') as f:
+                    yield _device_name(entry), f.read()
+    elif name.endswith(('.ndjson', '.jsonl')):
+        with open(path, 'rb') as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    yield record['device'], record['config']
+    elif name.endswith('.zip'):
+        import zipfile
+
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                yield _device_name(info.filename), archive.read(info).decode('utf-8')
+    else:
+        import tarfile
+
+        with open(path, 'rb') as raw:
+            source = raw
+            if name.endswith(('.tar.zst', '.tzst')):
+                source = _zstandard().ZstdDecompressor().stream_reader(raw)
+            with tarfile.open(fileobj=source, mode='r|*') as archive:
+                for member in archive:
+                    if member.isfile():
+                        yield _device_name(member.name), archive.extractfile(member).read().decode('utf-8')
@@ -0,0 +1,107 @@
+# snapshot.py
+#
+# Binary cache of a parsed inventory. The parsed Devices are pickled together with
+# the CSV's size, mtime and content hash; a reload whose key still matches unpickles
+# the Devices instead of validating and parsing every row again. Unpickling runs
+# code from the file, so snapshots live in a private per-user cache directory and
+# never next to the CSV, where anyone able to write the inventory could plant one.
+
+import gc
+import hashlib
+import os
+import pickle
+from pathlib import Path
+from typing import List, Optional, Tuple
+from models import Device
+
+# Bump whenever Device, WanInterface or NetworkAddress change shape
+SNAPSHOT_VERSION = 2
+SNAPSHOT_SUFFIX = ".mesh-snapshot"
+HASH_CHUNK_SIZE = 1 << 20
+CACHE_DIR_NAME = "mesh-me"
+
+def cache_dir() -> Optional[Path]:
+    # The user's snapshot directory, or None when it cannot be created or is not
+    # private to the user, in which case snapshots are skipped
+    base = (os.environ.get('XDG_CACHE_HOME') or os.environ.get('LOCALAPPDATA')
+            or os.path.join(os.path.expanduser('~'), '.cache'))
+    path = Path(base) / CACHE_DIR_NAME
+    try:
+        path.mkdir(mode=0o700, parents=True, exist_ok=True)
+        stat = path.stat()
+    except OSError:
+        return None
+    if hasattr(os, 'getuid') and (stat.st_uid != os.getuid() or stat.st_mode & 0o077):
+        return None
+    return path
+
+def _default_path(csv_file: str) -> Optional[Path]:
+    directory = cache_dir()
+    if directory is None:
+        return None
+    # One snapshot per inventory path
+    name = hashlib.sha256(os.path.abspath(csv_file).encode()).hexdigest()[:32]
+    return directory / f"{name}{SNAPSHOT_SUFFIX}"
+
+class InventorySnapshot:
+    def __init__(self, csv_file: str, path: Optional[str] = None):
+        self.csv_file = csv_file
+        self.path = Path(path) if path else _default_path(csv_file)
+        self._key: Optional[Tuple[int, int, str]] = None
+
+    def _stat(self) -> Tuple[int, int]:
+        stat = os.stat(self.csv_file)
+        return stat.st_size, stat.st_mtime_ns
+
+    def _digest(self) -> str:
+        digest = hashlib.sha256()
+        with open(self.csv_file, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def key(self) -> Tuple[int, int, str]:
+        # Taken before the CSV is parsed so a save never pairs new content with an old key
+        if self._key is None:
+            self._key = (*self._stat(), self._digest())
+        return self._key
+
+    def load(self) -> Optional[List[Device]]:
+        # Returns None when there is no snapshot or it is stale or unreadable. Size and
+        # mtime are compared first so a changed CSV is rejected without hashing it.
+        if self.path is None:
+            return None
+        try:
+            with open(self.path, 'rb') as f:
+                version, size, mtime_ns, digest = pickle.load(f)
+                if version != SNAPSHOT_VERSION or (size, mtime_ns) != self._stat():
+                    return None
+                if digest != self.key()[2]:
+                    return None
+                # Unpickling allocates many small objects; collection passes over them
+                # would only slow the load down
+                gc_enabled = gc.isenabled()
+                gc.disable()
+                try:
+                    return pickle.load(f)
+                finally:
+                    if gc_enabled:
+                        gc.enable()
+        except (OSError, EOFError, ValueError, TypeError, AttributeError, pickle.UnpicklingError):
+            return None
+
+    def save(self, devices: List[Device]):
+        # Best effort: an unusable cache directory just means no cache
+        if self.path is None:
+            return
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump((SNAPSHOT_VERSION, *self.key()), f, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(devices, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
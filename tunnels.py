@@ -0,0 +1,115 @@
+# tunnels.py
+
+from array import array
+from typing import Iterator, List, Set
+from models import Device, TunnelInterface
+from utils import int_to_ip
+
+# 'I' is 4 bytes on every platform we target, but the C standard only promises 2
+IP_TYPECODE = 'I' if array('I').itemsize >= 4 else 'L'
+
+class TunnelTable:
+    # Every tunnel edge is stored once, as a row across typed column arrays:
+    # device/WAN indices of both ends, both tunnel addresses as integers and the
+    # tunnel number used on each device. TunnelInterface objects are only built
+    # on demand through DeviceTunnelView.
+    def __init__(self, devices: List[Device]):
+        self.devices = devices
+        self._device_index = {id(device): index for index, device in enumerate(devices)}
+
+        self.device_a = array('I')
+        self.wan_a = array('B')
+        self.device_b = array('I')
+        self.wan_b = array('B')
+        self.ip_a = array(IP_TYPECODE)
+        self.ip_b = array(IP_TYPECODE)
+        self.tunnel_a = array('H')
+        self.tunnel_b = array('H')
+        self._device_rows = [array('I') for _ in devices]
+
+    def __len__(self) -> int:
+        return len(self.device_a)
+
+    def index_of(self, device: Device) -> int:
+        return self._device_index[id(device)]
+
+    def add(self, device1: int, wan1: int, ip1: int, tunnel1: int,
+            device2: int, wan2: int, ip2: int, tunnel2: int):
+        row = len(self.device_a)
+        self.device_a.append(device1)
+        self.wan_a.append(wan1)
+        self.ip_a.append(ip1)
+        self.tunnel_a.append(tunnel1)
+        self.device_b.append(device2)
+        self.wan_b.append(wan2)
+        self.ip_b.append(ip2)
+        self.tunnel_b.append(tunnel2)
+        self._device_rows[device1].append(row)
+        self._device_rows[device2].append(row)
+
+    def add_from(self, other: 'TunnelTable', row: int, device_a: int, device_b: int):
+        # Copies a row of other; device_a and device_b are its ends' indices in this table
+        self.add(device_a, other.wan_a[row], other.ip_a[row], other.tunnel_a[row],
+                 device_b, other.wan_b[row], other.ip_b[row], other.tunnel_b[row])
+
+    def tunnel_count(self, device_index: int) -> int:
+        return len(self._device_rows[device_index])
+
+    def peer_indices(self, device_index: int) -> Set[int]:
+        device_a, device_b = self.device_a, self.device_b
+        return {device_b[row] if device_a[row] == device_index else device_a[row]
+                for row in self._device_rows[device_index]}
+
+    def view(self, device_index: int) -> 'DeviceTunnelView':
+        return DeviceTunnelView(self, device_index)
+
+    def interface(self, device_index: int, row: int) -> TunnelInterface:
+        # Orient the row so the requested device is the local end
+        if self.device_a[row] == device_index:
+            return self._interface(self.device_a[row], self.wan_a[row], self.ip_a[row], self.tunnel_a[row],
+                                   self.device_b[row], self.wan_b[row], self.ip_b[row])
+        return self._interface(self.device_b[row], self.wan_b[row], self.ip_b[row], self.tunnel_b[row],
+                               self.device_a[row], self.wan_a[row], self.ip_a[row])
+
+    def _interface(self, local_device: int, local_wan: int, local_ip: int, tunnel_number: int,
+                   remote_device: int, remote_wan: int, remote_ip: int) -> TunnelInterface:
+        remote = self.devices[remote_device]
+        source_wan = self.devices[local_device].wan_interfaces[local_wan]
+        destination_wan = remote.wan_interfaces[remote_wan]
+        return TunnelInterface(
+            name=f"tunnel{tunnel_number}",
+            source_wan=source_wan,
+            destination_wan=destination_wan,
+            local_ip=int_to_ip(local_ip),
+            remote_ip=int_to_ip(remote_ip),
+            is_primary=source_wan.is_primary and destination_wan.is_primary,
+            remote_device=remote.name,
+            remote_as=remote.bgp_as_numbers[0]
+        )
+
+    def iter_device(self, device_index: int) -> Iterator[TunnelInterface]:
+        for row in self._device_rows[device_index]:
+            yield self.interface(device_index, row)
+
+class DeviceTunnelView:
+    # Read-only sequence standing in for Device.tunnel_interfaces
+    __slots__ = ('table', 'device_index')
+
+    def __init__(self, table: TunnelTable, device_index: int):
+        self.table = table
+        self.device_index = device_index
+
+    def __len__(self) -> int:
+        return self.table.tunnel_count(self.device_index)
+
+    def __iter__(self) -> Iterator[TunnelInterface]:
+        return self.table.iter_device(self.device_index)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        return self.table.interface(self.device_index, self.table._device_rows[self.device_index][index])
+
+    def __reduce__(self):
+        # Ship only this device's tunnels to worker processes, not the whole table
+        return (list, (list(self),))
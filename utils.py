@@ -1,20 +1,75 @@
-from typing import Set
+from typing import Iterable, List, Set, Tuple
 import csv
 from pathlib import Path
+from ipaddress import IPv4Address
+
+REQUIRED_HEADERS: Set[str] = {
+    'device_name', 'site_id', 'location', 'wan_ips', 'wan_interfaces',
+    'wan_gateways', 'local_networks', 'bgp_as_number', 'bgp_neighbor_as'
+}
+
+def check_headers(headers) -> None:
+    missing_headers = REQUIRED_HEADERS - set(headers or [])
+    if missing_headers:
+        raise ValueError(f"Missing required headers: {', '.join(sorted(missing_headers))}")
 
 def validate_csv_headers(file_path: str) -> bool:
-    required_headers: Set[str] = {
-        'device_name', 'site_id', 'location', 'wan_ips', 'wan_interfaces',
-        'wan_gateways', 'local_networks', 'bgp_as_number', 'bgp_neighbor_as'
-    }
-    
     try:
         with open(file_path, 'r') as f:
-            headers = set(next(csv.reader(f), []))
-            
-        missing_headers = required_headers - headers
-        if missing_headers:
-            raise ValueError(f"Missing required headers: {', '.join(missing_headers)}")
+            check_headers(next(csv.reader(f), []))
         return True
     except Exception as e:
-        raise ValueError(f"Error validating CSV headers: {e}")
\ No newline at end of file
+        raise ValueError(f"Error validating CSV headers: {e}")
+
+def ip_to_int(ip: str) -> int:
+    return int(IPv4Address(ip))
+
+def int_to_ip(value: int) -> str:
+    return f"{value >> 24}.{(value >> 16) & 255}.{(value >> 8) & 255}.{value & 255}"
+
+def prefix_to_netmask(prefix_length: int) -> str:
+    return int_to_ip((0xFFFFFFFF << (32 - prefix_length)) & 0xFFFFFFFF)
+
+def netmask_to_prefix(netmask: str) -> int:
+    # Accepts a netmask or, like IPv4Network, a host mask such as 0.0.0.255
+    mask = ip_to_int(netmask)
+    for candidate in (mask, ~mask & 0xFFFFFFFF):
+        host_bits = (~candidate & 0xFFFFFFFF)
+        if host_bits & (host_bits + 1) == 0:
+            return 32 - host_bits.bit_length()
+    raise ValueError(f"{netmask} is not a valid netmask")
+
+def aggregate_prefixes(ranges: Iterable[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    # Smallest list of (network, prefix length) blocks covering exactly the union of the
+    # inclusive (first, last) address ranges: adjacent and overlapping ranges are merged
+    # and each merged range is cut into the largest aligned blocks that fit
+    merged = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], last)
+        else:
+            merged.append([first, last])
+
+    blocks = []
+    for first, last in merged:
+        while first <= last:
+            size = first & -first if first else 1 << 32
+            while size > last - first + 1:
+                size >>= 1
+            blocks.append((first, 33 - size.bit_length()))
+            first += size
+    return blocks
+
+def load_edge_list(file_path: str) -> List[Tuple[str, str]]:
+    # One site pair per row in the first two columns, with an optional
+    # device_a,device_b header; blank rows and rows starting with # are ignored
+    edges = []
+    with open(file_path, 'r') as f:
+        for row in csv.reader(f):
+            cells = [cell.strip() for cell in row]
+            if len(cells) < 2 or not cells[0] or cells[0].startswith('#'):
+                continue
+            edges.append((cells[0], cells[1]))
+    if edges and edges[0] == ('device_a', 'device_b'):
+        edges.pop(0)
+    return edges
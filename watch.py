@@ -0,0 +1,217 @@
+# watch.py
+#
+# Long-running regeneration. A WatchSession keeps the parsed devices, the tunnel
+# graph with its allocations and the fingerprint of every written config between
+# runs. After an edit only changed CSV rows are parsed again; edits that leave the
+# tunnel graph alone are patched into the existing devices, and only devices whose
+# fingerprint changed are rendered and written.
+
+import csv
+import os
+import time
+from threading import Event
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from models import Device
+from network import NetworkBuilder, TunnelAddressManager
+from ledger import TunnelLedger
+from incremental import BuildManifest, device_fingerprint
+from inventory import InventoryError, RowError, address_problems, validate_row
+from generators import ConfigGenerator, RenderContext
+from sinks import DirectorySink
+from utils import check_headers
+
+# Seconds between polls of the CSV, and how long it has to stay unchanged before a run
+POLL_INTERVAL = 0.5
+DEBOUNCE = 0.3
+
+# (devices, previous edges) -> (devices to configure, hub sites, edges), as resolved for
+# generate; previous edges let capacity-bound hub assignments stay put across rebuilds
+TopologyResolver = Callable[[List[Device], Optional[list]], Tuple[List[Device], Optional[List[str]], Optional[list]]]
+
+def _topology_key(device: Device) -> tuple:
+    # Everything the tunnel graph depends on; other edits are patched in place
+    return device.name, device.site_id, device.region, tuple(wan.ip for wan in device.wan_interfaces)
+
+class WatchSession:
+    def __init__(self, csv_file: str, output_dir: str, topology: str, resolve: TopologyResolver,
+                 compact: bool = False, ledger_path: Optional[str] = None):
+        self.csv_file = csv_file
+        self.topology = topology
+        self.resolve = resolve
+        self.sink = DirectorySink(output_dir)
+        self.context = RenderContext(compact)
+        self.manifest = BuildManifest(output_dir, compact)
+        # The ledger keeps subnets and tunnel numbers of unchanged pairs stable across
+        # rebuilds; without a ledger file it lives in memory for the session
+        self.ledger = TunnelLedger(ledger_path or ":memory:")
+
+        self.rows: Dict[str, tuple] = {}
+        self.devices: List[Device] = []
+        self.configured: List[Device] = []
+        self.builder: Optional[NetworkBuilder] = None
+        self.fingerprints: Dict[str, str] = {}
+
+    def close(self):
+        self.ledger.close()
+
+    def _read_rows(self) -> Tuple[List[Tuple[int, str, dict, tuple]], List[RowError]]:
+        rows = []
+        errors = []
+        first_seen: Dict[str, int] = {}
+        with open(self.csv_file, 'r', newline='') as f:
+            reader = csv.DictReader(f)
+            check_headers(reader.fieldnames)
+            for row in reader:
+                name = (row.get('device_name') or "").strip()
+                if name in first_seen:
+                    errors.append(RowError(reader.line_num, name, 'device_name',
+                                           f"duplicate of line {first_seen[name]}"))
+                    continue
+                first_seen[name] = reader.line_num
+                rows.append((reader.line_num, name, row, tuple(row.items())))
+        return rows, errors
+
+    def _parse_changed(self, rows, errors: List[RowError]) -> Tuple[List[Device], List[Device]]:
+        # Returns the new device list in CSV order and the devices whose row changed;
+        # unchanged rows keep their existing Device
+        current = {device.name: device for device in self.devices}
+        devices = []
+        changed = []
+        for line, name, row, key in rows:
+            if self.rows.get(name) == key and name in current:
+                devices.append(current[name])
+                continue
+            problems = validate_row(row)
+            if not problems:
+                try:
+                    device = Device(row)
+                except Exception as e:
+                    problems = address_problems(row) or [('row', str(e))]
+            else:
+                problems.extend(address_problems(row))
+            if problems:
+                errors.extend(RowError(line, name, field, message) for field, message in problems)
+                continue
+            devices.append(device)
+            changed.append(device)
+        return devices, changed
+
+    def refresh(self) -> Tuple[int, int]:
+        # Applies the current CSV. Returns (configs written, devices configured); raises
+        # InventoryError and keeps the previous state when a row is invalid.
+        rows, errors = self._read_rows()
+        devices, changed = self._parse_changed(rows, errors)
+        if errors:
+            raise InventoryError(errors)
+
+        previous = {device.name: device for device in self.devices}
+        current = {device.name for device in devices}
+        removed = [name for name in previous if name not in current]
+        rebuild = (self.builder is None or removed
+                   or [_topology_key(d) for d in devices] != [_topology_key(d) for d in self.devices])
+
+        if rebuild:
+            affected = self._rebuild(devices)
+        else:
+            affected = self._patch(changed, previous)
+        self.rows = {name: key for _, name, _, key in rows}
+
+        for name in removed:
+            self.fingerprints.pop(name, None)
+            self.manifest.devices.pop(name, None)
+            try:
+                self.sink.path_for(name).unlink()
+            except OSError:
+                pass
+        written = self._write(affected)
+        self.manifest.save()
+        return written, len(self.configured)
+
+    def _rebuild(self, devices: List[Device]) -> List[Device]:
+        # The tunnel graph changed. Pairs between devices kept from the previous build
+        # copy their tunnel rows, and only devices whose tunnels or hub role changed are
+        # returned for rendering. A failed build leaves the devices half built; force
+        # the next run to build from scratch.
+        previous = self.builder
+        previous_hubs = previous.hub_sites if previous is not None else []
+        self.builder = None
+        configured, hub_sites, edges = self.resolve(devices, previous.edges if previous is not None else None)
+        builder = NetworkBuilder(configured, self.topology, hub_sites, TunnelAddressManager(ledger=self.ledger), edges)
+        if previous is None:
+            builder.build()
+            affected = configured
+        else:
+            affected = [configured[index] for index in sorted(builder.build_from(previous, previous_hubs))]
+        self.devices = devices
+        self.configured = configured
+        self.builder = builder
+        return affected
+
+    def _patch(self, changed: List[Device], previous: Dict[str, Device]) -> List[Device]:
+        # Same tunnel graph: move the new fields onto the existing devices and re-render
+        # them plus their tunnel peers, which show their AS and addresses
+        tunnels = self.builder.tunnels
+        configured = {id(device) for device in self.configured}
+        affected: Set[int] = set()
+        for device in changed:
+            existing = previous[device.name]
+            existing.update_from(device)
+            if id(existing) in configured:
+                index = tunnels.index_of(existing)
+                affected.add(index)
+                affected.update(tunnels.peer_indices(index))
+        return [self.builder.devices[index] for index in sorted(affected)]
+
+    def _write(self, devices: List[Device]) -> int:
+        written = 0
+        for device in devices:
+            fingerprint = device_fingerprint(device, self.manifest.config_hash)
+            self.manifest.record(device.name, fingerprint)
+            path = self.sink.path_for(device.name)
+            known = self.fingerprints.get(device.name)
+            if known == fingerprint and path.exists():
+                continue
+            if known is None and self.manifest.is_current(device.name, fingerprint, path):
+                # Written by an earlier run or generate --incremental
+                self.fingerprints[device.name] = fingerprint
+                continue
+            with self.sink.open_config(device.name) as f:
+                ConfigGenerator.write_device_config(device, f, self.context)
+            self.fingerprints[device.name] = fingerprint
+            written += 1
+        return written
+
+def _file_state(path: str) -> Optional[tuple]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        # Editors that save by replacing the file make it vanish briefly
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+def watch(session: WatchSession, report: Callable[[str], None] = print, stop: Optional[Event] = None,
+          interval: float = POLL_INTERVAL, debounce: float = DEBOUNCE):
+    # Polls the CSV until stop is set. A run starts once the file has stayed unchanged
+    # for `debounce` seconds, so a burst of saves regenerates once.
+    stop = stop or Event()
+
+    def run():
+        start = time.perf_counter()
+        try:
+            written, configured = session.refresh()
+        except (InventoryError, ValueError, OSError) as e:
+            report(f"Error: {e}")
+            return
+        report(f"Wrote {written} of {configured} configuration files in {time.perf_counter() - start:.3f}s")
+
+    run()
+    state = _file_state(session.csv_file)
+    changed_at = None
+    while not stop.wait(interval):
+        current = _file_state(session.csv_file)
+        if current != state:
+            state = current
+            changed_at = time.monotonic()
+        elif changed_at is not None and current is not None and time.monotonic() - changed_at >= debounce:
+            changed_at = None
+            run()